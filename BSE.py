@@ -52,11 +52,19 @@
 
 import sys
 import math
+import types
+import bisect
+import heapq
+import collections
+import array
 import random
 import os
+import concurrent.futures
 import time as chrono
 import csv
-from datetime import datetime
+import hashlib
+import struct
+import numpy as np
 import bse_config
 
 # a bunch of system constants (globals)
@@ -64,6 +72,8 @@ bse_sys_minprice = 1                    # minimum price in the system, in cents/
 bse_sys_maxprice = 500                  # maximum price in the system, in cents/pennies
 # ticksize should be a param of an exchange (so different exchanges can have different ticksizes)
 ticksize = 1  # minimum change in price, in cents/pennies
+# global verbosity flag, used in a few places (e.g. PRZI respond); the __main__ block below may switch it on
+verbose = False
 
 
 # an Order/quote has a trader id, a type (buy/sell) price, quantity, timestamp, and unique i.d.
@@ -72,8 +82,11 @@ class Order:
     An Order: this is used both for client-orders from exogenous customers to the robot traders acting as sales traders,
     and for the trader-orders (aka quotes) sent by the robot traders to the BSE exchange.
     In both use-cases, an order has a trader-i.d., a type (buy/sell), price, quantity, timestamp, and unique quote-i.d.
+    Orders are created in huge numbers, so they have __slots__ rather than a per-instance __dict__.
     """
 
+    __slots__ = ('tid', 'otype', 'price', 'qty', 'time', 'qid')
+
     def __init__(self, tid, otype, price, qty, time, qid):
         self.tid = tid  # trader i.d.
         self.otype = otype  # order type
@@ -87,10 +100,60 @@ class Order:
                (self.tid, self.otype, self.price, self.qty, self.time, self.qid)
 
 
+class Trade:
+    """
+    The record of a trade, as returned by Exchange.process_order() and kept in the traders' blotters.
+    A compact __slots__ record that can be read either as attributes (trade.price) or, as the original
+    dictionary records were, by key (trade['price']): the keys are 'type', 'time', 'price', 'party1', 'party2', 'qty'.
+    """
+
+    __slots__ = ('time', 'price', 'party1', 'party2', 'qty')
+
+    type = 'Trade'
+    trade_keys = ('type', 'time', 'price', 'party1', 'party2', 'qty')
+
+    def __init__(self, time, price, party1, party2, qty):
+        """
+        :param time: the time of the trade.
+        :param price: the price of the trade.
+        :param party1: trader-id of the counterparty whose order was resting on the LOB.
+        :param party2: trader-id of the trader whose order crossed the spread.
+        :param qty: the quantity traded.
+        """
+        self.time = time
+        self.price = price
+        self.party1 = party1
+        self.party2 = party2
+        self.qty = qty
+
+    def __getitem__(self, key):
+        if key in Trade.trade_keys:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def keys(self):
+        return self.trade_keys
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        """ the trade as a stand-alone dictionary, in the same format as the original trade records """
+        return {key: getattr(self, key) for key in self.trade_keys}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
 class OrderbookHalf:
     """
     OrderbookHalf is one side of the book: a list of bids or a list of asks, each sorted best-price-first,
     and with orders at the same price arranged by arrival time (oldest first) for time-priority processing.
+    The price-levels are maintained incrementally: adding, overwriting, or deleting an order touches only
+    the price-level(s) it is on, so there is no need to rebuild the whole book on every event.
     """
 
     def __init__(self, booktype, worstprice):
@@ -103,9 +166,14 @@ class OrderbookHalf:
         self.booktype = booktype
         # dictionary of orders received, indexed by Trader ID
         self.orders = {}
+        # arrival sequence-number of each trader's entry in self.orders, used for time-priority within a price-level
+        self.order_seq = {}
+        self.next_seq = 0
         # limit order book, dictionary indexed by price, with order info
         self.lob = {}
-        # anonymized LOB, lists, with only price/qty info
+        # sorted list of the prices currently on the lob (ascending), kept in step with lob_anon
+        self.lob_prices = []
+        # anonymized LOB, a list of (price, qty) tuples; a level's tuple is replaced, never altered, when it changes
         self.lob_anon = []
         # summary stats
         self.best_price = None
@@ -114,43 +182,63 @@ class OrderbookHalf:
         self.session_extreme = None    # most extreme price quoted in this session
         self.n_orders = 0  # how many orders?
         self.lob_depth = 0  # how many different prices on lob?
+        self.version = 0  # incremented every time this side of the book changes
 
-    def anonymize_lob(self):
+    def level_add(self, order):
         """
-        anonymize a lob, strip out order details, format as a sorted list
-        NB for asks, the sorting should be reversed
+        Add an order to the price-level for its price, creating the level if need be.
+        Orders at the same price are kept in order of their sequence-number in self.orders.
+        :param order: the order to be added; self.order_seq must already hold its sequence-number.
         :return: <nothing>
         """
-        self.lob_anon = []
-        for price in sorted(self.lob):
-            qty = self.lob[price][0]
-            self.lob_anon.append([price, qty])
+        price = order.price
+        entry = [order.time, order.qty, order.tid, order.qid]
+        level = self.lob.get(price)
+        if level is None:
+            # create a new price-level, and slot it into the sorted price list and anonymized lob
+            self.lob[price] = [order.qty, [entry]]
+            index = bisect.bisect_left(self.lob_prices, price)
+            self.lob_prices.insert(index, price)
+            self.lob_anon.insert(index, (price, order.qty))
+        else:
+            # update existing price-level
+            seq = self.order_seq
+            orderlist = level[1]
+            position = bisect.bisect_right(orderlist, seq[order.tid], key=lambda item: seq[item[2]])
+            orderlist.insert(position, entry)
+            level[0] = level[0] + order.qty
+            self.lob_anon[bisect.bisect_left(self.lob_prices, price)] = (price, level[0])
+
+    def level_del(self, order):
+        """
+        Remove an order from the price-level for its price, deleting the level if that leaves it empty.
+        :param order: the order to be removed, as currently held in self.orders.
+        :return: <nothing>
+        """
+        price = order.price
+        level = self.lob[price]
+        seq = self.order_seq
+        orderlist = level[1]
+        position = bisect.bisect_left(orderlist, seq[order.tid], key=lambda item: seq[item[2]])
+        del (orderlist[position])
+        index = bisect.bisect_left(self.lob_prices, price)
+        if len(orderlist) > 0:
+            level[0] = level[0] - order.qty
+            self.lob_anon[index] = (price, level[0])
+        else:
+            # that was the last order at this price
+            del (self.lob[price])
+            del (self.lob_prices[index])
+            del (self.lob_anon[index])
 
-    def build_lob(self):
+    def set_best(self):
         """
-        Take a list of orders and build a limit-order-book (lob) from it
-        NB the exchange needs to know arrival times and trader-id associated with each order
-        also builds anonymized version (just price/quantity, sorted, as a list) for publishing to traders
-        :return: lob as a dictionary (i.e., unsorted)
+        Record best price and associated trader-id, and the depth of the lob.
+        Called after every change to the book, so this also bumps the book's version number.
+        :return: <nothing>
         """
-        lob_verbose = False
-        self.lob = {}
-        for tid in self.orders:
-            order = self.orders.get(tid)
-            price = order.price
-            if price in self.lob:
-                # update existing entry
-                qty = self.lob[price][0]
-                orderlist = self.lob[price][1]
-                orderlist.append([order.time, order.qty, order.tid, order.qid])
-                self.lob[price] = [qty + order.qty, orderlist]
-            else:
-                # create a new dictionary entry
-                self.lob[price] = [order.qty, [[order.time, order.qty, order.tid, order.qid]]]
-        # create anonymized version
-        self.anonymize_lob()
-        # record best price and associated trader-id
-        if len(self.lob) > 0:
+        self.version += 1
+        if len(self.lob_anon) > 0:
             if self.booktype == 'Bid':
                 self.best_price = self.lob_anon[-1][0]
             else:
@@ -159,6 +247,27 @@ class OrderbookHalf:
         else:
             self.best_price = None
             self.best_tid = None
+        self.lob_depth = len(self.lob_anon)
+
+    def build_lob(self):
+        """
+        Take a list of orders and build a limit-order-book (lob) from it, from scratch.
+        NB the exchange needs to know arrival times and trader-id associated with each order
+        also builds anonymized version (just price/quantity, sorted, as a list) for publishing to traders.
+        In normal running the lob is maintained incrementally, so this is only needed as a check or after
+        self.orders has been changed directly.
+        :return: <nothing>
+        """
+        lob_verbose = False
+        self.lob = {}
+        self.lob_prices = []
+        self.lob_anon = []
+        for tid in self.orders:
+            if tid not in self.order_seq:
+                self.order_seq[tid] = self.next_seq
+                self.next_seq += 1
+            self.level_add(self.orders[tid])
+        self.set_best()
 
         if lob_verbose:
             print(self.lob)
@@ -180,9 +289,17 @@ class OrderbookHalf:
 
         # add the order to the book
         n_orders = self.n_orders
+        old_order = self.orders.get(order.tid)
+        if old_order is not None:
+            # overwrite: the order keeps its place in the sequence, but may move to a different price
+            self.level_del(old_order)
+        else:
+            self.order_seq[order.tid] = self.next_seq
+            self.next_seq += 1
         self.orders[order.tid] = order
         self.n_orders = len(self.orders)
-        self.build_lob()
+        self.level_add(order)
+        self.set_best()
         # print('book_add < %s %s' % (order, self.orders))
         if n_orders != self.n_orders:
             return 'Addition'
@@ -197,10 +314,13 @@ class OrderbookHalf:
         :param order: the order to be deleted.
         :return: <nothing>
         """
-        if self.orders.get(order.tid) is not None:
+        old_order = self.orders.get(order.tid)
+        if old_order is not None:
+            self.level_del(old_order)
             del (self.orders[order.tid])
+            del (self.order_seq[order.tid])
             self.n_orders = len(self.orders)
-            self.build_lob()
+            self.set_best()
         # print('book_del %s', self.orders)
 
     def delete_best(self):
@@ -208,48 +328,588 @@ class OrderbookHalf:
         When the best bid/ask has been hit/lifted, delete it from the book.
         :return: TraderID of the deleted order is return-value, as counterparty to the trade.
         """
+        best_price_counterparty = self.best_tid
+        self.level_del(self.orders[best_price_counterparty])
+        del (self.orders[best_price_counterparty])
+        del (self.order_seq[best_price_counterparty])
+        self.n_orders = self.n_orders - 1
+        self.set_best()
+        return best_price_counterparty
 
-        best_price_orders = self.lob[self.best_price]
-        best_price_qty = best_price_orders[0]
-        best_price_counterparty = best_price_orders[1][0][2]
-        if best_price_qty == 1:
-            # here the order deletes the best price
-            del (self.lob[self.best_price])
-            del (self.orders[best_price_counterparty])
-            self.n_orders = self.n_orders - 1
-            if self.n_orders > 0:
-                if self.booktype == 'Bid':
-                    self.best_price = max(self.lob.keys())
-                else:
-                    self.best_price = min(self.lob.keys())
-                self.lob_depth = len(self.lob.keys())
+
+class OrderbookHalfTicks(OrderbookHalf):
+    """
+    Alternative implementation of OrderbookHalf for BSE's bounded integer price-grid.
+    Instead of a dictionary of price-levels that has to be kept sorted, each side of the book is a fixed array of
+    per-tick quantities with a FIFO queue of orders at each tick, plus a pointer to the best tick that is maintained
+    as orders arrive and leave. The quantity array is contiguous in memory, so it can be snapshot cheaply.
+    Prices must be on the grid bse_sys_minprice + n*ticksize; if a quote arrives outside the current grid
+    (e.g. a PRZI ask above bse_sys_maxprice) the arrays are extended to cover it.
+    The public interface (orders, lob, lob_anon, best_price, best_tid, n_orders, etc.) is the same as OrderbookHalf.
+    """
+
+    def __init__(self, booktype, worstprice):
+        """
+        Create one side of the LOB
+        :param booktype: specifies bid or ask side of the LOB.
+        :param worstprice: the initial value of the worst price currently showing on the LOB.
+        """
+        # booktype: bids or asks?
+        self.booktype = booktype
+        # dictionary of orders received, indexed by Trader ID
+        self.orders = {}
+        # arrival sequence-number of each trader's entry in self.orders, used for time-priority within a tick
+        self.order_seq = {}
+        self.next_seq = 0
+        # the price-grid: tick i is at price tick_base + i*ticksize
+        n_ticks = int((bse_sys_maxprice - bse_sys_minprice) // ticksize) + 1
+        self.tick_base = bse_sys_minprice
+        self.tick_qty = array.array('q', bytes(8 * n_ticks))    # total quantity on the lob at each tick
+        self.tick_orders = [None] * n_ticks                     # FIFO queue of orders at each tick, None if empty
+        self.lo_tick = None     # lowest tick with nonzero quantity, None if this side of the book is empty
+        self.hi_tick = None     # highest tick with nonzero quantity, None if this side of the book is empty
+        self.anon = None        # cached anonymized LOB; None when it needs rebuilding
+        # summary stats
+        self.best_price = None
+        self.best_tid = None
+        self.worstprice = worstprice
+        self.session_extreme = None    # most extreme price quoted in this session
+        self.n_orders = 0  # how many orders?
+        self.lob_depth = 0  # how many different prices on lob?
+        self.version = 0  # incremented every time this side of the book changes
+
+    @property
+    def lob_anon(self):
+        """
+        Anonymized LOB, a list of (price, qty) tuples, sorted by ascending price.
+        Built from the tick arrays when first asked for after the book has changed.
+        """
+        if self.anon is None:
+            if self.lo_tick is None:
+                self.anon = []
             else:
-                self.best_price = self.worstprice
-                self.lob_depth = 0
+                qty = self.tick_qty
+                base = self.tick_base
+                self.anon = [(base + i * ticksize, qty[i]) for i in range(self.lo_tick, self.hi_tick + 1) if qty[i]]
+        return self.anon
+
+    @property
+    def lob(self):
+        """
+        Limit order book as a dictionary indexed by price, with order info, in the same form as OrderbookHalf.lob.
+        Built on demand: the exchange itself works from the tick arrays.
+        """
+        lob = {}
+        if self.lo_tick is not None:
+            for i in range(self.lo_tick, self.hi_tick + 1):
+                if self.tick_qty[i] > 0:
+                    lob[self.tick_base + i * ticksize] = [self.tick_qty[i], list(self.tick_orders[i])]
+        return lob
+
+    def tick_index(self, price):
+        """
+        Return the index of the tick for a given price, extending the grid if the price is beyond it.
+        :param price: the price.
+        :return: index into tick_qty and tick_orders.
+        """
+        index, off_grid = divmod(price - self.tick_base, ticksize)
+        if off_grid != 0:
+            sys.exit('FAIL: price %s is not on the tick grid' % price)
+        index = int(index)
+        if index < 0:
+            # extend the grid downwards, with some slack so that this doesn't happen too often
+            n_new = len(self.tick_qty) // 2 - index
+            self.tick_qty = array.array('q', bytes(8 * n_new)) + self.tick_qty
+            self.tick_orders = [None] * n_new + self.tick_orders
+            self.tick_base -= n_new * ticksize
+            if self.lo_tick is not None:
+                self.lo_tick += n_new
+                self.hi_tick += n_new
+            index += n_new
+        elif index >= len(self.tick_qty):
+            # extend the grid upwards
+            n_new = len(self.tick_qty) // 2 + index - len(self.tick_qty) + 1
+            self.tick_qty.extend(array.array('q', bytes(8 * n_new)))
+            self.tick_orders.extend([None] * n_new)
+        return index
+
+    def level_add(self, order):
+        """
+        Add an order to the FIFO queue at its tick.
+        Orders at the same tick are kept in order of their sequence-number in self.orders.
+        :param order: the order to be added; self.order_seq must already hold its sequence-number.
+        :return: <nothing>
+        """
+        i = self.tick_index(order.price)
+        entry = [order.time, order.qty, order.tid, order.qid]
+        queue = self.tick_orders[i]
+        if queue is None:
+            self.tick_orders[i] = [entry]
+            self.lob_depth += 1
+            if self.lo_tick is None:
+                self.lo_tick = i
+                self.hi_tick = i
+            elif i < self.lo_tick:
+                self.lo_tick = i
+            elif i > self.hi_tick:
+                self.hi_tick = i
         else:
-            # best_bid_qty>1 so the order decrements the quantity of the best bid
-            # update the lob with the decremented order data
-            self.lob[self.best_price] = [best_price_qty - 1, best_price_orders[1][1:]]
-
-            # update the bid list: counterparty's bid has been deleted
-            del (self.orders[best_price_counterparty])
-            self.n_orders = self.n_orders - 1
-        self.build_lob()
-        return best_price_counterparty
+            seq = self.order_seq
+            queue.insert(bisect.bisect_right(queue, seq[order.tid], key=lambda item: seq[item[2]]), entry)
+        self.tick_qty[i] += order.qty
+
+    def level_del(self, order):
+        """
+        Remove an order from the FIFO queue at its tick, moving the lo/hi pointers if that empties an extreme tick.
+        :param order: the order to be removed, as currently held in self.orders.
+        :return: <nothing>
+        """
+        i = self.tick_index(order.price)
+        seq = self.order_seq
+        queue = self.tick_orders[i]
+        del (queue[bisect.bisect_left(queue, seq[order.tid], key=lambda item: seq[item[2]])])
+        self.tick_qty[i] -= order.qty
+        if len(queue) == 0:
+            self.tick_orders[i] = None
+            self.lob_depth -= 1
+            if self.lo_tick == self.hi_tick:
+                # that was the only occupied tick
+                self.lo_tick = None
+                self.hi_tick = None
+            elif i == self.lo_tick:
+                while self.tick_orders[self.lo_tick] is None:
+                    self.lo_tick += 1
+            elif i == self.hi_tick:
+                while self.tick_orders[self.hi_tick] is None:
+                    self.hi_tick -= 1
+
+    def set_best(self):
+        """
+        Record best price and associated trader-id, and mark the anonymized lob as needing a rebuild.
+        Called after every change to the book, so this also bumps the book's version number.
+        :return: <nothing>
+        """
+        self.version += 1
+        if self.lo_tick is not None:
+            if self.booktype == 'Bid':
+                best_tick = self.hi_tick
+            else:
+                best_tick = self.lo_tick
+            self.best_price = self.tick_base + best_tick * ticksize
+            self.best_tid = self.tick_orders[best_tick][0][2]
+        else:
+            self.best_price = None
+            self.best_tid = None
+        self.anon = None
+
+    def build_lob(self):
+        """
+        Rebuild the tick arrays from scratch from self.orders.
+        In normal running the arrays are maintained incrementally, so this is only needed as a check or after
+        self.orders has been changed directly.
+        :return: <nothing>
+        """
+        self.tick_qty = array.array('q', bytes(8 * len(self.tick_qty)))
+        self.tick_orders = [None] * len(self.tick_qty)
+        self.lo_tick = None
+        self.hi_tick = None
+        self.lob_depth = 0
+        for tid in self.orders:
+            if tid not in self.order_seq:
+                self.order_seq[tid] = self.next_seq
+                self.next_seq += 1
+            self.level_add(self.orders[tid])
+        self.set_best()
+
+    def snapshot(self):
+        """
+        Cheap copy of this side of the book's per-tick quantities.
+        :return: tuple (tick_base, tick_qty): tick_qty[i] is the quantity at price tick_base + i*ticksize.
+        """
+        return self.tick_base, self.tick_qty[:]
+
+
+class TapeEvent:
+    """
+    Lightweight read-only view of one event on a Tape.
+    Supports the same dictionary-style access as the original tape records:
+    trades have keys 'type', 'time', 'price', 'party1', 'party2', 'qty';
+    cancellations have keys 'type', 'time', 'order' (the Order is rebuilt from the tape's columns on demand).
+    A view refers to an absolute event number, so once the event has dropped off the end of the tape
+    (or the tape has been wiped) the view is stale and reading from it is an error.
+    """
+
+    __slots__ = ('tape', 'event_n')
+
+    trade_keys = ('type', 'time', 'price', 'party1', 'party2', 'qty')
+    cancel_keys = ('type', 'time', 'order')
+
+    def __init__(self, tape, event_n):
+        self.tape = tape
+        self.event_n = event_n
+
+    def __getitem__(self, key):
+        tape = self.tape
+        if self.event_n < tape.first:
+            raise IndexError('tape event %d is no longer on the tape' % self.event_n)
+        i = self.event_n % tape.maxlen
+        if key == 'type':
+            return Tape.kinds[tape.kind[i]]
+        if key == 'time':
+            return tape.time[i]
+        if tape.kind[i] == Tape.TRADE:
+            if key == 'price':
+                return tape.price_at(i)
+            if key == 'party1':
+                return tape.party1[i]
+            if key == 'party2':
+                return tape.party2[i]
+            if key == 'qty':
+                return tape.qty[i]
+        elif key == 'order':
+            return Order(tape.party1[i], Tape.sides[tape.side[i]], tape.price_at(i),
+                         tape.qty[i], tape.otime[i], tape.qid[i])
+        raise KeyError(key)
+
+    def keys(self):
+        if self['type'] == 'Trade':
+            return self.trade_keys
+        return self.cancel_keys
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        """ the event as a stand-alone dictionary, in the same format as the original tape records """
+        return {key: self[key] for key in self.keys()}
+
+    def __str__(self):
+        return str(self.as_dict())
+
+
+class TapeTrades:
+    """
+    Trade-only view of a Tape, backed by the tape's index of the event numbers of its trades,
+    so the trades can be read without skipping over the cancellations mixed in with them.
+    Indexed like a list, oldest trade first: trades[-1] is the most recent trade, trades[-k] the k'th most recent,
+    and slices give lists; items are TapeEvent views. Only the trades still on the tape are included.
+    """
+
+    __slots__ = ('tape',)
+
+    def __init__(self, tape):
+        self.tape = tape
+
+    def __len__(self):
+        tape = self.tape
+        return tape.n_trades - tape.first_trade()
+
+    def event_n(self, pos):
+        """
+        The absolute tape event number of a trade.
+        :param pos: the trade's position in this view (negative counts back from the most recent).
+        :return: the event number.
+        """
+        tape = self.tape
+        first_trade = tape.first_trade()
+        if pos < 0:
+            trade_n = tape.n_trades + pos
+        else:
+            trade_n = first_trade + pos
+        if trade_n < first_trade or trade_n >= tape.n_trades:
+            raise IndexError('trade index out of range')
+        return tape.trade_event_n[trade_n % tape.maxlen]
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [TapeEvent(self.tape, self.event_n(p)) for p in range(*pos.indices(len(self)))]
+        return TapeEvent(self.tape, self.event_n(pos))
+
+    def __iter__(self):
+        tape = self.tape
+        for trade_n in range(tape.first_trade(), tape.n_trades):
+            yield TapeEvent(tape, tape.trade_event_n[trade_n % tape.maxlen])
+
+
+class TradeSMA:
+    """
+    Simple moving average of the prices of the last n trades on a Tape, updated as each trade is appended,
+    so that reading it is O(1) however many cancellations are mixed in with the trades.
+    """
+
+    def __init__(self, n):
+        """
+        Create an empty moving average.
+        :param n: the number of trades averaged over.
+        """
+        self.n = n
+        self.event_ns = collections.deque(maxlen=n)     # absolute tape event numbers of the last n trades
+        self.prices = collections.deque(maxlen=n)       # ...and their prices
+        self.total = 0                                  # sum of self.prices (exact, as long as the prices are ints)
+
+    def add(self, event_n, price):
+        """
+        Add a trade to the window, dropping the oldest one if the window is full.
+        :param event_n: the trade's absolute event number on the tape.
+        :param price: the trade price.
+        :return: <nothing>
+        """
+        if len(self.prices) == self.n:
+            self.total = self.total - self.prices[0]
+        self.event_ns.append(event_n)
+        self.prices.append(price)
+        self.total = self.total + price
+
+    def value(self, first):
+        """
+        The moving average.
+        :param first: the absolute event number of the oldest tape event that may be included.
+        :return: the mean price of the last n trades, or None if fewer than n trades have event numbers >= first.
+        """
+        if len(self.prices) < self.n or self.event_ns[0] < first:
+            return None
+        return self.total / self.n
+
+
+class Tape:
+    """
+    The exchange's tape: a fixed-capacity ring-buffer of the most recent trades and cancellations,
+    stored column-wise in parallel typed arrays rather than as one dictionary per event.
+    Trader-ids are integers (see Trader), so they go straight into the party columns.
+    Individual events are read via lightweight TapeEvent views, e.g. tape[-1]['type'];
+    whole columns can be pulled out as NumPy arrays via to_numpy().
+    """
+
+    # event-type codes in the kind column
+    TRADE = 0
+    CANCEL = 1
+    kinds = ('Trade', 'Cancel')
+    # order-type codes in the side column
+    sides = ('Bid', 'Ask')
+
+    def __init__(self, maxlen):
+        """
+        Create an empty tape.
+        :param maxlen: the number of events held; appending to a full tape overwrites the oldest event.
+        """
+        self.maxlen = maxlen
+        self.time = array.array('d', bytes(8 * maxlen))         # time of the event
+        self.kind = array.array('b', bytes(maxlen))             # TRADE or CANCEL
+        self.price = array.array('d', bytes(8 * maxlen))        # trade price, or price of the cancelled order
+        self.price_int = array.array('b', bytes(maxlen))        # 1 if the price was an int (most are)
+        self.qty = array.array('q', bytes(8 * maxlen))          # quantity traded/cancelled
+        self.party1 = array.array('q', bytes(8 * maxlen))       # counterparty (trade) or owner (cancel)
+        self.party2 = array.array('q', bytes(8 * maxlen))       # aggressor (trade), -1 for cancellations
+        self.side = array.array('b', bytes(maxlen))             # 0=>Bid, 1=>Ask: aggressor side or cancelled side
+        self.qid = array.array('q', bytes(8 * maxlen))          # quote-id of the aggressing/cancelled order
+        self.otime = array.array('d', bytes(8 * maxlen))        # timestamp of the aggressing/cancelled order
+        self.n_events = 0       # total number of events ever appended
+        self.first = 0          # absolute event number of the oldest event still on the tape
+        self.smas = {}          # n => TradeSMA over the last n trades, for each n passed to register_sma()
+        # index of the trades: the event number of each trade, in a ring-buffer of its own
+        # (NB there can never be more trades than events on the tape, so it needs no more room than the tape)
+        self.trade_event_n = array.array('q', bytes(8 * maxlen))
+        self.n_trades = 0       # total number of trades ever appended
+        self.trade_lo = 0       # absolute trade number at or before the oldest trade still on the tape
+
+    @property
+    def trades(self):
+        """
+        Trade-only view of the tape (see TapeTrades).
+        Made afresh on each access rather than held by the tape, so the tape and its view don't form a reference
+        cycle that keeps the tape's arrays alive until the cyclic garbage collector gets round to them.
+        """
+        return TapeTrades(self)
+
+    def price_at(self, i):
+        """ price stored at array index i, as an int if it was given as one """
+        if self.price_int[i]:
+            return int(self.price[i])
+        return self.price[i]
+
+    def next_slot(self):
+        """ claim the array index for the next event, dropping the oldest event if the tape is full """
+        i = self.n_events % self.maxlen
+        self.n_events += 1
+        if self.n_events - self.first > self.maxlen:
+            self.first = self.n_events - self.maxlen
+        return i
+
+    def append_trade(self, time, price, party1, party2, qty, order):
+        """
+        Write a trade onto the tape.
+        :param time: the time of the trade.
+        :param price: the price of the trade.
+        :param party1: trader-id of the counterparty whose order was resting on the LOB.
+        :param party2: trader-id of the trader whose order crossed the spread.
+        :param qty: the quantity traded.
+        :param order: the order that crossed the spread.
+        :return: <nothing>
+        """
+        i = self.next_slot()
+        self.time[i] = time
+        self.kind[i] = Tape.TRADE
+        self.price[i] = price
+        self.price_int[i] = isinstance(price, int)
+        self.qty[i] = qty
+        self.party1[i] = party1
+        self.party2[i] = party2
+        self.side[i] = order.otype == 'Ask'
+        self.qid[i] = order.qid
+        self.otime[i] = order.time
+        self.trade_event_n[self.n_trades % self.maxlen] = self.n_events - 1
+        self.n_trades += 1
+        for sma in self.smas.values():
+            sma.add(self.n_events - 1, price)
+
+    def append_cancel(self, time, order):
+        """
+        Write a cancellation onto the tape.
+        :param time: the time of the cancellation.
+        :param order: the order that was cancelled.
+        :return: <nothing>
+        """
+        i = self.next_slot()
+        self.time[i] = time
+        self.kind[i] = Tape.CANCEL
+        self.price[i] = order.price
+        self.price_int[i] = isinstance(order.price, int)
+        self.qty[i] = order.qty
+        self.party1[i] = order.tid
+        self.party2[i] = -1
+        self.side[i] = order.otype == 'Ask'
+        self.qid[i] = order.qid
+        self.otime[i] = order.time
+
+    def first_trade(self):
+        """
+        The absolute trade number of the oldest trade still on the tape (n_trades if there are none).
+        :return: the trade number.
+        """
+        # trades drop off the tape in the order they were appended, so trade_lo only ever has to move forward
+        trade_lo = max(self.trade_lo, self.n_trades - self.maxlen)
+        while trade_lo < self.n_trades and self.trade_event_n[trade_lo % self.maxlen] < self.first:
+            trade_lo += 1
+        self.trade_lo = trade_lo
+        return trade_lo
+
+    def recent_trade_prices(self, n, min_pos=0):
+        """
+        Prices of the most recent trades, newest first, found via the index of trades.
+        :param n: how many trade prices are wanted; fewer are returned if there aren't enough trades on the tape.
+        :param min_pos: only the events at tape[min_pos:] are included.
+        :return: list of prices.
+        """
+        prices = []
+        maxlen = self.maxlen
+        stop = self.first + min_pos
+        first_trade = self.first_trade()
+        trade_n = self.n_trades - 1
+        while len(prices) < n and trade_n >= first_trade:
+            event_n = self.trade_event_n[trade_n % maxlen]
+            if event_n < stop:
+                break
+            prices.append(self.price_at(event_n % maxlen))
+            trade_n -= 1
+        return prices
+
+    def register_sma(self, n):
+        """
+        Keep a running simple moving average of the last n trade prices from now on (see sma()).
+        :param n: the number of trades averaged over.
+        :return: <nothing>
+        """
+        if n not in self.smas:
+            sma = TradeSMA(n)
+            # start it off with the trades already on the tape
+            for trade_n in range(self.first_trade(), self.n_trades):
+                event_n = self.trade_event_n[trade_n % self.maxlen]
+                sma.add(event_n, self.price_at(event_n % self.maxlen))
+            self.smas[n] = sma
+
+    def sma(self, n, min_pos=0):
+        """
+        Mean price of the n most recent trades: O(1) if n has been registered with register_sma(),
+        otherwise worked out from recent_trade_prices().
+        :param n: the number of trades averaged over.
+        :param min_pos: only trades at tape[min_pos:] count.
+        :return: the mean price, or None if there are fewer than n trades at tape[min_pos:].
+        """
+        sma = self.smas.get(n)
+        if sma is not None:
+            return sma.value(self.first + min_pos)
+        prices = self.recent_trade_prices(n, min_pos)
+        if len(prices) < n:
+            return None
+        return sum(prices) / n
+
+    def clear(self):
+        """ wipe the tape: any existing TapeEvent views become stale """
+        self.first = self.n_events
+
+    def __len__(self):
+        return self.n_events - self.first
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [TapeEvent(self, self.first + p) for p in range(*pos.indices(len(self)))]
+        if pos < 0:
+            event_n = self.n_events + pos
+        else:
+            event_n = self.first + pos
+        if event_n < self.first or event_n >= self.n_events:
+            raise IndexError('tape index out of range')
+        return TapeEvent(self, event_n)
+
+    def __iter__(self):
+        for event_n in range(self.first, self.n_events):
+            yield TapeEvent(self, event_n)
+
+    def to_numpy(self):
+        """
+        Copy the events currently on the tape into NumPy arrays, oldest first, without creating per-event objects.
+        :return: dictionary of column-name => numpy array.
+        """
+        n = len(self)
+        start = self.first % self.maxlen
+        cols = {}
+        for name in ('time', 'kind', 'price', 'qty', 'party1', 'party2', 'side', 'qid', 'otime'):
+            col = np.frombuffer(getattr(self, name), dtype=getattr(self, name).typecode)
+            cols[name] = np.concatenate((col[start:start + n], col[:max(0, start + n - self.maxlen)]))
+        return cols
 
 
 class Orderbook(OrderbookHalf):
     """ Orderbook for a single tradeable asset: list of bids and list of asks """
 
-    def __init__(self):
-        """Construct a new orderbook"""
+    def __init__(self, lob_impl='levels'):
+        """
+        Construct a new orderbook
+        :param lob_impl: how each half of the book is implemented:
+                'levels' => dictionary of price-levels (OrderbookHalf);
+                'ticks' => per-tick arrays over the bounded price-grid (OrderbookHalfTicks).
+        """
 
-        self.bids = OrderbookHalf('Bid', bse_sys_minprice)
-        self.asks = OrderbookHalf('Ask', bse_sys_maxprice)
-        self.tape = []
+        if lob_impl == 'levels':
+            book_half = OrderbookHalf
+        elif lob_impl == 'ticks':
+            book_half = OrderbookHalfTicks
+        else:
+            sys.exit('FAIL: unknown lob_impl %s' % lob_impl)
+        self.bids = book_half('Bid', bse_sys_minprice)
+        self.asks = book_half('Ask', bse_sys_maxprice)
         self.tape_length = 10000    # max events on in-memory tape (older events can be written to tape_dump file)
+        # the tape is a columnar ring-buffer: appending to a full tape drops the oldest item
+        self.tape = Tape(self.tape_length)
         self.quote_id = 0           # unique ID code for each quote accepted onto the book
-        self.lob_string = ''        # character-string linearization of public lob items with nonzero quantities
+        self.published = None               # cached public LOB data, see publish_lob()
+        self.published_bids = None          # cached public data for each side of the book...
+        self.published_asks = None
+        self.published_versions = (None, None)  # ...and the (bids.version, asks.version) they were built from
+        self.published_tape = (None, None)      # ...and the (tape.first, tape.n_events) the trade SMAs were built from
 
 
 class Exchange(Orderbook):
@@ -267,16 +927,11 @@ class Exchange(Orderbook):
         self.quote_id = order.qid + 1
         if vrbs:
             print('add_order QID=%d self.quote.id=%d' % (order.qid, self.quote_id))
+        # NB book_add() also updates the best price and trader-id on that side of the book
         if order.otype == 'Bid':
             response = self.bids.book_add(order)
-            best_price = self.bids.lob_anon[-1][0]
-            self.bids.best_price = best_price
-            self.bids.best_tid = self.bids.lob[best_price][1][0][2]
         else:
             response = self.asks.book_add(order)
-            best_price = self.asks.lob_anon[0][0]
-            self.asks.best_price = best_price
-            self.asks.best_tid = self.asks.lob[best_price][1][0][2]
         return [order.qid, response]
 
     def del_order(self, time, order, tape_file, vrbs):
@@ -292,41 +947,32 @@ class Exchange(Orderbook):
         if vrbs:
             print('del_order QID=%d' % order.qid)
         if order.otype == 'Bid':
+            # NB book_del() also updates the best price and trader-id on this side of the book
             self.bids.book_del(order)
-            if self.bids.n_orders > 0:
-                best_price = self.bids.lob_anon[-1][0]
-                self.bids.best_price = best_price
-                self.bids.best_tid = self.bids.lob[best_price][1][0][2]
-            else:  # this side of book is empty
-                self.bids.best_price = None
-                self.bids.best_tid = None
-            cancel_record = {'type': 'Cancel', 'time': time, 'order': order}
             if tape_file is not None:
                 tape_file.write('CAN, %f, %d, Bid, %d\n' % (time, order.qid, order.price))
-            self.tape.append(cancel_record)
-            # right-truncate the tape so that it keeps only the most recent items
-            self.tape = self.tape[-self.tape_length:]
+            self.tape.append_cancel(time, order)
 
         elif order.otype == 'Ask':
+            # NB book_del() also updates the best price and trader-id on this side of the book
             self.asks.book_del(order)
-            if self.asks.n_orders > 0:
-                best_price = self.asks.lob_anon[0][0]
-                self.asks.best_price = best_price
-                self.asks.best_tid = self.asks.lob[best_price][1][0][2]
-            else:  # this side of book is empty
-                self.asks.best_price = None
-                self.asks.best_tid = None
-            
-            cancel_record = {'type': 'Cancel', 'time': time, 'order': order}
             if tape_file is not None:
                 tape_file.write('CAN, %f, %d, Ask, %d\n' % (time, order.qid, order.price))
-            self.tape.append(cancel_record)
-            # right-truncate the tape so that it keeps only the most recent items
-            self.tape = self.tape[-self.tape_length:]
+            self.tape.append_cancel(time, order)
         else:
             # neither bid nor ask?
             sys.exit('bad order type in del_quote()')
 
+    def is_resting(self, order):
+        """
+        Is this order (this very object, not just one like it) currently resting on the LOB?
+        :param order: the order in question.
+        :return: Boolean.
+        """
+        if order.otype == 'Bid':
+            return self.bids.orders.get(order.tid) is order
+        return self.asks.orders.get(order.tid) is order
+
     def process_order(self, time, order, tape_file, vrbs):
         """
         Process an order from a trader -- this is the BSE Matching Engine.
@@ -334,7 +980,7 @@ class Exchange(Orderbook):
         :param order: the order to be processed.
         :param tape_file: if is not None then write details of transaction to tape_file
         :param vrbs: verbosity: if True, print a running commentary; if False, stay silent.
-        :return: transaction_record if the order results in a transaction, otherwise None.
+        :return: a Trade record if the order results in a transaction, otherwise None.
         """
         # receive an order and either add it to the relevant LOB (ie treat as limit order)
         # or if it crosses the best counterparty offer, execute it (treat as a market order)
@@ -388,18 +1034,10 @@ class Exchange(Orderbook):
             # process the trade
             if vrbs:
                 print('>>>>>>>>>>>>>>>>>TRADE t=%010.3f $%d %s %s' % (time, price, counterparty, order.tid))
-            transaction_record = {'type': 'Trade',
-                                  'time': time,
-                                  'price': price,
-                                  'party1': counterparty,
-                                  'party2': order.tid,
-                                  'qty': order.qty
-                                  }
+            transaction_record = Trade(time, price, counterparty, order.tid, order.qty)
             if tape_file is not None:
                 tape_file.write('TRD, %f, %d\n' % (time, price))
-            self.tape.append(transaction_record)
-            # right-truncate the tape so that it keeps only the most recent items
-            self.tape = self.tape[-self.tape_length:]
+            self.tape.append_trade(time, price, counterparty, order.tid, order.qty, order)
 
             return transaction_record
         else:
@@ -415,64 +1053,62 @@ class Exchange(Orderbook):
         """
         dumpfile = open(fname, fmode)
         dumpfile.write('Event Type, Time, Price\n')
-        for tapeitem in self.tape:
-            if tapeitem['type'] == 'Trade':
-                dumpfile.write('Trd, %010.3f, %s\n' % (tapeitem['time'], tapeitem['price']))
+        for tapeitem in self.tape.trades:
+            dumpfile.write('Trd, %010.3f, %s\n' % (tapeitem['time'], tapeitem['price']))
         dumpfile.close()
         if tmode == 'wipe':
-            self.tape = []
+            self.tape.clear()
 
-    def publish_lob(self, time, lob_file, vrbs):
+    def publish_lob(self, time, lob_frames, vrbs):
         """
         Returns the public LOB data published by the exchange, 
         i.e. the version of the LOB that's accessible to the traders.
+        The public data is cached: it is only rebuilt if the time, the quote-id, the version number of either side
+        of the book, or the tape has changed since the last call, so repeated calls within a timestep return the
+        same object.
+        The returned data is read-only (the dictionaries are wrapped in MappingProxyType, and each side's 'lob' is
+        a tuple of (price, qty) tuples, copied from the book when that side changes, so an earlier snapshot is
+        never altered by later changes to the book) and must not be altered;
+        NB the 'tape' entry is the exchange's live tape, so it is always up-to-date.
+        The 'trades' entry is the live trade-only view of the tape (see TapeTrades).
+        The 'trade_sma' entry maps each n registered with the tape (see Tape.register_sma()) to the mean price of
+        the last n trades, or None if there are not yet n; as the PT traders have always done, the oldest event on
+        the tape, tape[0], is left out.
         :param time: the current time.
-        :param lob_file: 
+        :param lob_frames: if not None, a LOBFrameWriter that is given the chance to write a frame of the LOB.
         :param vrbs: verbosity: if True, print a running commentary; if False, stay silent.
         :return: the public LOB data.
         """
-        public_data = dict()
-        public_data['time'] = time
-        public_data['bids'] = {'best': self.bids.best_price,
-                               'worst': self.bids.worstprice,
-                               'n': self.bids.n_orders,
-                               'lob': self.bids.lob_anon}
-        public_data['asks'] = {'best': self.asks.best_price,
-                               'worst': self.asks.worstprice,
-                               'sess_hi': self.asks.session_extreme,
-                               'n': self.asks.n_orders,
-                               'lob': self.asks.lob_anon}
-        public_data['QID'] = self.quote_id
-        public_data['tape'] = self.tape
-
-        if lob_file is not None:
-            # build a linear character-string summary of only those prices on LOB with nonzero quantities
-            lobstring = 'Bid:,'
-            n_bids = len(self.bids.lob_anon)
-            if n_bids > 0:
-                lobstring += '%d,' % n_bids
-                for lobitem in self.bids.lob_anon:
-                    price_str = '%d,' % lobitem[0]
-                    qty_str = '%d,' % lobitem[1]
-                    lobstring = lobstring + price_str + qty_str
-            else:
-                lobstring += '0,'
-            lobstring += 'Ask:,'
-            n_asks = len(self.asks.lob_anon)
-            if n_asks > 0:
-                lobstring += '%d,' % n_asks
-                for lobitem in self.asks.lob_anon:
-                    price_str = '%d,' % lobitem[0]
-                    qty_str = '%d,' % lobitem[1]
-                    lobstring = lobstring + price_str + qty_str
-            else:
-                lobstring += '0,'
-            # is this different to the last lob_string?
-            if lobstring != self.lob_string:
-                # write it
-                lob_file.write('%.3f, %s\n' % (time, lobstring))
-                # remember it
-                self.lob_string = lobstring
+        versions = (self.bids.version, self.asks.version)
+        tape_state = (self.tape.first, self.tape.n_events)
+        public_data = self.published
+        if public_data is None or versions != self.published_versions or tape_state != self.published_tape or \
+                time != public_data['time'] or self.quote_id != public_data['QID']:
+            if versions[0] != self.published_versions[0]:
+                self.published_bids = types.MappingProxyType({'best': self.bids.best_price,
+                                                              'worst': self.bids.worstprice,
+                                                              'n': self.bids.n_orders,
+                                                              'lob': tuple(self.bids.lob_anon)})
+            if versions[1] != self.published_versions[1]:
+                self.published_asks = types.MappingProxyType({'best': self.asks.best_price,
+                                                              'worst': self.asks.worstprice,
+                                                              'sess_hi': self.asks.session_extreme,
+                                                              'n': self.asks.n_orders,
+                                                              'lob': tuple(self.asks.lob_anon)})
+            self.published_versions = versions
+            self.published_tape = tape_state
+            public_data = types.MappingProxyType({'time': time,
+                                                  'bids': self.published_bids,
+                                                  'asks': self.published_asks,
+                                                  'QID': self.quote_id,
+                                                  'tape': self.tape,
+                                                  'trades': self.tape.trades,
+                                                  'trade_sma': types.MappingProxyType(
+                                                      {n: self.tape.sma(n, 1) for n in self.tape.smas})})
+            self.published = public_data
+
+        if lob_frames is not None:
+            lob_frames.write(time, self.bids, self.asks)
 
         if vrbs:
             vstr = 'publish_lob: t=%f' % time
@@ -485,6 +1121,206 @@ class Exchange(Orderbook):
         return public_data
 
 
+class LOBFrameWriter:
+    """
+    Writes frames of the public LOB (the anonymized price/quantity ladders on each side of the book) to file,
+    writing a new frame only when the book has changed since the last frame was written.
+    Changes are detected from the book version numbers, and the ladders are only compared when a version has moved.
+    Three formats:
+        'csv' => one line of text per frame, the BSE *_LOB_frames.csv format:
+                 time, Bid:,n_bids,price,qty,...,Ask:,n_asks,price,qty,...,
+        'binary' => after an 8-byte header (LOBFrameWriter.magic), each frame is a little-endian struct
+                 of time (double), n_bids, n_asks (uint32), followed by n_bids+n_asks (price, qty) pairs of int32,
+                 bids first; read back with read_lob_frames().
+        'delta' => text, one line per frame: every keyframe_interval frames a full keyframe,
+                 time, K, Bid:,n_bids,price,qty,...,Ask:,n_asks,price,qty,...,
+                 and in between only the price-levels that changed since the previous frame,
+                 time, D, side,price,qty,...,   (side is B or A; qty=0 means that price-level has gone)
+    Use LOBFrameReader to reconstruct the book at any time from a file in any of these formats.
+    """
+
+    magic = b'BSELOB1\n'
+    frame_header = struct.Struct('<dII')
+
+    def __init__(self, fname_stem, fmt='csv', keyframe_interval=100):
+        """
+        Open the frame file.
+        :param fname_stem: filename without extension; '.csv', '.bin', or '_delta.csv' is added, depending on fmt.
+        :param fmt: the file format: 'csv', 'binary', or 'delta'.
+        :param keyframe_interval: for fmt='delta', the number of frames from one full keyframe to the next.
+        """
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.file = open(fname_stem + '.csv', 'w')
+        elif fmt == 'binary':
+            self.file = open(fname_stem + '.bin', 'wb')
+            self.file.write(LOBFrameWriter.magic)
+        elif fmt == 'delta':
+            self.file = open(fname_stem + '_delta.csv', 'w')
+        else:
+            sys.exit('FAIL: unknown LOB frame format %s' % fmt)
+        self.keyframe_interval = keyframe_interval
+        self.versions = None    # (bids.version, asks.version) when the book was last checked
+        self.bids = None        # copy of the bid ladder in the last frame written, as a dictionary price=>qty
+        self.asks = None        # copy of the ask ladder in the last frame written, as a dictionary price=>qty
+        self.n_frames = 0
+
+    @staticmethod
+    def ladder_str(lob_anon):
+        """ n,price,qty,price,qty,... for one side of the book """
+        fields = ['%d' % len(lob_anon)]
+        fields.extend(['%d,%d' % (price, qty) for price, qty in lob_anon])
+        return ','.join(fields)
+
+    @staticmethod
+    def ladder_changes(side, old, new, fields):
+        """ append side,price,qty to fields for each price-level that differs between ladder dicts old and new """
+        for price in old:
+            if price not in new:
+                fields.append('%s,%d,0' % (side, price))
+        for price in new:
+            if old.get(price) != new[price]:
+                fields.append('%s,%d,%d' % (side, price, new[price]))
+
+    def write(self, time, bids, asks):
+        """
+        Write a frame if the book has changed since the last frame.
+        :param time: the current time.
+        :param bids: the bid side of the book (an OrderbookHalf).
+        :param asks: the ask side of the book (an OrderbookHalf).
+        :return: True if a frame was written, else False.
+        """
+        versions = (bids.version, asks.version)
+        if versions == self.versions:
+            return False
+        self.versions = versions
+        bid_anon = bids.lob_anon
+        ask_anon = asks.lob_anon
+        # NB take copies: OrderbookHalf updates its lob_anon list in place
+        new_bids = {price: qty for price, qty in bid_anon}
+        new_asks = {price: qty for price, qty in ask_anon}
+        if new_bids == self.bids and new_asks == self.asks:
+            # the book changed but ended up with the same ladders (e.g. an overwrite at the same price)
+            return False
+        if self.fmt == 'csv':
+            self.file.write('%.3f, Bid:,%s,Ask:,%s,\n' % (time, self.ladder_str(bid_anon), self.ladder_str(ask_anon)))
+        elif self.fmt == 'binary':
+            ladder = array.array('i', [int(x) for item in bid_anon for x in item])
+            ladder.extend([int(x) for item in ask_anon for x in item])
+            self.file.write(LOBFrameWriter.frame_header.pack(time, len(bid_anon), len(ask_anon)))
+            self.file.write(ladder.tobytes())
+        elif self.n_frames % self.keyframe_interval == 0:
+            self.file.write('%.3f, K, Bid:,%s,Ask:,%s,\n' %
+                            (time, self.ladder_str(bid_anon), self.ladder_str(ask_anon)))
+        else:
+            fields = ['%.3f, D' % time]
+            self.ladder_changes('B', self.bids, new_bids, fields)
+            self.ladder_changes('A', self.asks, new_asks, fields)
+            self.file.write(','.join(fields) + ',\n')
+        self.bids = new_bids
+        self.asks = new_asks
+        self.n_frames += 1
+        return True
+
+    def close(self):
+        self.file.close()
+
+
+def read_lob_frames(fname):
+    """
+    Read back a binary LOB frames file written by LOBFrameWriter.
+    :param fname: the name of the file.
+    :return: generator of (time, bids, asks) tuples, where bids and asks are lists of [price, qty], ascending price.
+    """
+    header = LOBFrameWriter.frame_header
+    with open(fname, 'rb') as f:
+        if f.read(len(LOBFrameWriter.magic)) != LOBFrameWriter.magic:
+            sys.exit('FAIL: %s is not a binary LOB frames file' % fname)
+        while True:
+            buf = f.read(header.size)
+            if len(buf) < header.size:
+                break
+            time, n_bids, n_asks = header.unpack(buf)
+            ladder = array.array('i')
+            ladder.frombytes(f.read(8 * (n_bids + n_asks)))
+            items = [[ladder[i], ladder[i + 1]] for i in range(0, len(ladder), 2)]
+            yield time, items[:n_bids], items[n_bids:]
+
+
+class LOBFrameReader:
+    """
+    Reconstructs the public LOB at any time from a file written by LOBFrameWriter, in any of its formats.
+    The whole file is parsed once, keeping each frame as either a keyframe (full ladders) or a list of changes;
+    csv and binary files are all keyframes. book_at() then finds the most recent keyframe at or before the
+    requested time and replays the changes that follow it.
+    """
+
+    def __init__(self, fname):
+        """
+        Load a LOB frames file.
+        :param fname: the name of the file.
+        """
+        self.times = []         # time of each frame
+        self.frames = []        # each frame is ('K', bids_dict, asks_dict) or ('D', [(side, price, qty), ...])
+        self.keyframes = []     # indexes into self.frames of the keyframes, ascending
+        with open(fname, 'rb') as f:
+            binary = f.read(len(LOBFrameWriter.magic)) == LOBFrameWriter.magic
+        if binary:
+            for time, bids, asks in read_lob_frames(fname):
+                self.add_keyframe(time, bids, asks)
+        else:
+            with open(fname, 'r') as f:
+                for line in f:
+                    self.parse_line(line)
+
+    def add_keyframe(self, time, bids, asks):
+        self.keyframes.append(len(self.frames))
+        self.times.append(time)
+        self.frames.append(('K', {price: qty for price, qty in bids}, {price: qty for price, qty in asks}))
+
+    def parse_line(self, line):
+        """ parse one line of a csv or delta frames file """
+        fields = line.strip().rstrip(',').split(',')
+        time = float(fields[0])
+        if fields[1].strip() == 'D':
+            changes = []
+            for i in range(2, len(fields), 3):
+                changes.append((fields[i], int(fields[i + 1]), int(fields[i + 2])))
+            self.times.append(time)
+            self.frames.append(('D', changes))
+        else:
+            # keyframe: fields are [time, (K,) Bid:, n_bids, p, q, ..., Ask:, n_asks, p, q, ...]
+            i = fields.index(' Bid:') if ' Bid:' in fields else fields.index(' K') + 1
+            n_bids = int(fields[i + 1])
+            bids = [[int(fields[i + 2 + 2 * b]), int(fields[i + 3 + 2 * b])] for b in range(n_bids)]
+            i = i + 2 + 2 * n_bids
+            n_asks = int(fields[i + 1])
+            asks = [[int(fields[i + 2 + 2 * a]), int(fields[i + 3 + 2 * a])] for a in range(n_asks)]
+            self.add_keyframe(time, bids, asks)
+
+    def book_at(self, time):
+        """
+        The public LOB as it was at a given time, i.e. as of the most recent frame at or before that time.
+        :param time: the time.
+        :return: (bids, asks), each a list of [price, qty] sorted by ascending price; both empty if time is
+                 before the first frame.
+        """
+        last = bisect.bisect_right(self.times, time) - 1
+        if last < 0:
+            return [], []
+        key = self.keyframes[bisect.bisect_right(self.keyframes, last) - 1]
+        bids = dict(self.frames[key][1])
+        asks = dict(self.frames[key][2])
+        for frame in self.frames[key + 1: last + 1]:
+            for side, price, qty in frame[1]:
+                ladder = bids if side == 'B' else asks
+                if qty == 0:
+                    del (ladder[price])
+                else:
+                    ladder[price] = qty
+        return [[price, bids[price]] for price in sorted(bids)], [[price, asks[price]] for price in sorted(asks)]
+
+
 # #################--Traders below here--#############
 
 
@@ -493,19 +1329,38 @@ class Exchange(Orderbook):
 class Trader:
     """The parent class for all types of robot trader in BSE"""
 
-    def __init__(self, ttype, tid, balance, params, time):
+    # does this type of trader need its respond() called after every event on the exchange?
+    # if False then it only uses Trader.respond(), which does nothing but update profitpertime, so market_session()
+    # skips it in the respond loop and brings its profitpertime up to date at the end of the session instead.
+    needs_respond = True
+
+    # can this type of trader's respond() give it an order of its own, without a customer order being issued to it?
+    # (PT1 and PT2 do this.) The event-driven scheduler in market_session() re-checks wants_poll() for these only.
+    orders_itself = False
+
+    # numbers of recent trades that this trader wants moving averages of trade prices over:
+    # market_session() registers them with the exchange's tape, which then publishes them in the LOB (as 'trade_sma')
+    trade_sma_windows = ()
+
+    def __init__(self, ttype, tid, balance, params, time, rng=None, tname=None):
         """
         Initializes a generic trader with attributes common to all/most types of trader
         Some trader types (e.g. ZIP) then have additional specialised initialization steps
         :param ttype: the trader type
-        :param tid: the trader I.D. (a non-negative integer)
+        :param tid: the trader I.D. (a non-negative integer): populate_market() numbers the traders densely from 0,
+                buyers first, then sellers, then proptraders, so a tid can be used to index per-trader arrays.
         :param balance: how much money it has in the bank when it is created
         :param params: a set of parameter-values, for those trader-types that have parameters
         :param time: the time this trader was created
+        :param rng: the random-number generator this trader draws from (a random.Random); None => the random module
+        :param tname: the trader's name, e.g. B07, used when printing or writing to files; None => str(tid)
         """
         self.ttype = ttype          # what type / strategy this trader is
+        self.rng = random if rng is None else rng   # this trader's own stream of random numbers
         self.tid = tid              # trader unique ID code
-        self.balance = balance      # money in the bank
+        self.tname = str(tid) if tname is None else tname  # trader name, for output
+        self.bank = balance         # money in the bank: see the balance property
+        self.stats = None           # if not None, the TradeStats that changes in balance are reported to
         self.params = params        # parameters/extras associated with this trader-type or individual trader.
         self.blotter = []           # record of trades executed
         self.blotter_length = 100   # maximum length of blotter
@@ -520,7 +1375,18 @@ class Trader:
     def __str__(self):
         """ return a character-string that summarises a trader """
         return '[TID %s type %s balance %s blotter %s orders %s n_trades %s profitpertime %s]' \
-               % (self.tid, self.ttype, self.balance, self.blotter, self.orders, self.n_trades, self.profitpertime)
+               % (self.tname, self.ttype, self.balance, self.blotter, self.orders, self.n_trades, self.profitpertime)
+
+    @property
+    def balance(self):
+        """ how much money this trader has in the bank """
+        return self.bank
+
+    @balance.setter
+    def balance(self, value):
+        if self.stats is not None:
+            self.stats.balance_change(self.ttype, value - self.bank)
+        self.bank = value
 
     def add_order(self, order, vrbs):
         """
@@ -549,6 +1415,34 @@ class Trader:
         # this is lazy: assumes each trader has only one customer order with quantity=1, so deleting sole order
         self.orders = []
 
+    def quote(self, otype, price, qty, time, qid):
+        """
+        The order for a quote this trader is about to make: if it is identical to the trader's last quote then
+        that Order is reused (it may well still be resting on the LOB) and given the current time as its timestamp,
+        otherwise a new Order is created.
+        :param otype: 'Bid' or 'Ask'.
+        :param price: the quote price.
+        :param qty: the quantity.
+        :param time: the current time.
+        :param qid: the quote i.d. (NB the exchange sets this when the order is processed, so a reused order
+            keeps the quote i.d. it was given then).
+        :return: the order.
+        """
+        lastquote = self.lastquote
+        if lastquote is not None and lastquote.price == price and lastquote.otype == otype and lastquote.qty == qty:
+            lastquote.time = time
+            return lastquote
+        return Order(self.tid, otype, price, qty, time, qid)
+
+    def wants_poll(self):
+        """
+        Could calling getorder() right now do anything, i.e. return an order or change this trader's state?
+        The event-driven scheduler in market_session() only polls traders for which this is True:
+        a trader for which it is False must return None from getorder() and be left unchanged by the call.
+        :return: Boolean.
+        """
+        return len(self.orders) > 0
+
     def profitpertime_update(self, time, birthtime, totalprofit):
         """
         Calculates the trader's profit per unit time, but only if it has been alive longer than profit_mintime
@@ -632,6 +1526,8 @@ class TraderGiveaway(Trader):
     Trader subclass Giveaway (GVWY): even dumber than a ZI-U: just give the deal away (but never make a loss)
     """
 
+    needs_respond = False
+
     def getorder(self, time, countdown, lob):
         """
         Create this trader's order to be sent to the exchange.
@@ -648,11 +1544,7 @@ class TraderGiveaway(Trader):
             order = None
         else:
             quoteprice = self.orders[0].price
-            order = Order(self.tid,
-                          self.orders[0].otype,
-                          quoteprice,
-                          self.orders[0].qty,
-                          time, lob['QID'])
+            order = self.quote(self.orders[0].otype, quoteprice, self.orders[0].qty, time, lob['QID'])
             self.lastquote = order
         return order
 
@@ -662,6 +1554,8 @@ class TraderZIC(Trader):
     Trader subclass ZI-C: after Gode & Sunder 1993
     """
 
+    needs_respond = False
+
     def getorder(self, time, countdown, lob):
         """
         Create this trader's order to be sent to the exchange.
@@ -684,11 +1578,11 @@ class TraderZIC(Trader):
             limit = self.orders[0].price
             otype = self.orders[0].otype
             if otype == 'Bid':
-                quoteprice = random.randint(int(minprice), int(limit))
+                quoteprice = self.rng.randint(int(minprice), int(limit))
             else:
-                quoteprice = random.randint(int(limit), int(maxprice))
+                quoteprice = self.rng.randint(int(limit), int(maxprice))
                 # NB should check it == 'Ask' and barf if not
-            order = Order(self.tid, otype, quoteprice, self.orders[0].qty, time, qid)
+            order = self.quote(otype, quoteprice, self.orders[0].qty, time, qid)
             self.lastquote = order
         return order
 
@@ -699,6 +1593,8 @@ class TraderShaver(Trader):
     but if there is no best price, creates "stub quote" at system max/min
     """
 
+    needs_respond = False
+
     def getorder(self, time, countdown, lob):
         """
         Create this trader's order to be sent to the exchange.
@@ -730,7 +1626,7 @@ class TraderShaver(Trader):
                         quoteprice = limitprice
                 else:
                     quoteprice = lob['asks']['worst']
-            order = Order(self.tid, otype, quoteprice, self.orders[0].qty, time, lob['QID'])
+            order = self.quote(otype, quoteprice, self.orders[0].qty, time, lob['QID'])
             self.lastquote = order
         return order
 
@@ -742,6 +1638,8 @@ class TraderSniper(Trader):
     then gets increasing aggressive, increasing "shave thickness" as time runs out
     """
 
+    needs_respond = False
+
     def getorder(self, time, countdown, lob):
         """
         Create this trader's order to be sent to the exchange.
@@ -773,11 +1671,75 @@ class TraderSniper(Trader):
                         quoteprice = limitprice
                 else:
                     quoteprice = lob['asks']['worst']
-            order = Order(self.tid, otype, quoteprice, self.orders[0].qty, time, lob['QID'])
+            order = self.quote(otype, quoteprice, self.orders[0].qty, time, lob['QID'])
             self.lastquote = order
         return order
 
 
+class LRUCache:
+    """
+    A size-bounded cache that, when full, throws out whichever entry was least recently used.
+    Counts its hits and misses, so that how well it is working can be checked when profiling.
+    """
+
+    def __init__(self, maxsize):
+        """
+        Create an empty cache.
+        :param maxsize: the maximum number of entries.
+        """
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()   # least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Look up a key, and count it as a hit or a miss.
+        :param key: the key.
+        :return: the value for that key, or None if it is not in the cache.
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """
+        Add an entry, throwing out the least recently used one if the cache is full.
+        :param key: the key.
+        :param value: the value: not None.
+        :return: <nothing>
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """ empty the cache and reset its counters """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """
+        The cache's counters.
+        :return: dictionary {'size', 'maxsize', 'hits', 'misses', 'evictions', 'hit_rate'}
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hits / lookups if lookups > 0 else None}
+
+
 class TraderPRZI(Trader):
     """
     Cliff's Parameterized-Response Zero-Intelligence (PRZI) trader -- pronounced "prezzie"
@@ -787,8 +1749,211 @@ class TraderPRZI(Trader):
     or
        ++ a simple differential evolution (DE) optimizer with pop_size=k, hence PRZE-DE or PRDE ('purdy")
 
-    when optimizer == None then it implements plain-vanilla non-adaptive PRZI, with a fixed strategy-value.
-    """
+    when optimizer == None then it implements plain-vanilla non-adaptive PRZI, with a fixed strategy-value.
+    """
+
+    # CDF look-up tables, shared by all PRZI traders in the process: see cdf_lut().
+    # cdf_luts.stats() shows how often a trader needing a new table found it already there.
+    cdf_luts = LRUCache(4096)
+
+    @staticmethod
+    def calc_c(strategy, t0, m):
+        """
+        The constant c that sets the shape of the PRZI distribution for a given strategy-value.
+        :param strategy: strategy-value in [-1,+1]
+        :param t0: constant used in the threshold function
+        :param m: constant used in the threshold function
+        :return: c, which is never zero.
+        """
+
+        # the threshold function used to clip
+        def threshold(theta0, x):
+            t = max(-1*theta0, min(theta0, x))
+            return t
+
+        epsilon = 0.000001  # used to catch DIV0 errors
+
+        c = threshold(t0, m * math.tan(math.pi * (strategy + 0.5)))
+
+        # catch div0 errors here
+        if abs(c) < epsilon:
+            if c > 0:
+                c = epsilon
+            else:
+                c = -epsilon
+        return c
+
+    @staticmethod
+    def calc_cdf_lut(strategy, t0, m, dirn, pmin, pmax):
+        """
+        calculate cumulative distribution function (CDF) look-up table (LUT)
+        :param strategy: strategy-value in [-1,+1]
+        :param t0: constant used in the threshold function
+        :param m: constant used in the threshold function
+        :param dirn: direction: 'buy' or 'sell'
+        :param pmin: lower bound on discrete-valued price-range
+        :param pmax: upper bound on discrete-valued price-range
+        :return: {'strat': strategy, 'dirn': dirn, 'pmin': pmin, 'pmax': pmax, 'prices': prices, 'cdf': cdf}
+                where prices and cdf are read-only numpy arrays: cdf[i] is the probability of a price <= prices[i].
+        """
+
+        lut_vrbs = False
+
+        if (strategy > 1.0) or (strategy < -1.0):
+            # out of range
+            sys.exit('PRSH FAIL: strategy=%f out of range\n' % strategy)
+
+        if (dirn != 'buy') and (dirn != 'sell'):
+            # out of range
+            sys.exit('PRSH FAIL: bad dirn=%s\n' % dirn)
+
+        if pmax < pmin:
+            # screwed
+            sys.exit('PRSH FAIL: pmax %f < pmin %f \n' % (pmax, pmin))
+
+        if lut_vrbs:
+            print('PRSH calc_cdf_lut: strategy=%f dirn=%s pmin=%d pmax=%d\n' % (strategy, dirn, pmin, pmax))
+
+        p_range = float(pmax - pmin)
+        if p_range < 1:
+            # special case: the SHVR-style strategy has shaved all the way to the limit price
+            # the lower and upper bounds on the interval are adjacent prices;
+            # so cdf is simply the limit-price with probability 1
+            if dirn == 'buy':
+                prices = np.array([pmax])
+            else:   # must be a sell
+                prices = np.array([pmin])
+            cdf = np.ones(1)
+
+        else:
+            c = TraderPRZI.calc_c(strategy, t0, m)
+
+            e2cm1 = math.expm1(c)
+
+            # calculate the discrete calligraphic-P function over interval [pmin, pmax]
+            # (i.e., this is Equation 8 in the PRZI Technical Note)
+            prices = np.arange(pmin, pmax + 1)
+            # normalize the prices to proportion of their range
+            p_r = np.arange(len(prices)) / p_range  # p_r in [0.0, 1.0]
+            if strategy == 0.0:
+                # special case: this is just ZIC
+                cal_p = np.full(len(prices), 1 / (p_range + 1))
+            else:
+                if dirn == 'buy':
+                    exponents = c * p_r
+                else:   # dirn == 'sell'
+                    exponents = c * (1 - p_r)
+                cal_p = np.expm1(exponents) / e2cm1
+                if strategy < 0:
+                    cal_p = 1.0 - cal_p
+                cal_p = np.maximum(cal_p, 0)  # just in case
+
+            # NB cumsum() adds up in sequence, so these are the same sums as a running total in a loop would give
+            calp_sum = np.cumsum(cal_p)[-1]
+            if calp_sum <= 0:
+                print('calp_interval:', cal_p)
+                print('pmin=%f, pmax=%f, calp_sum=%f' % (pmin, pmax, calp_sum))
+
+            # normalize to give the CDF
+            cdf = np.cumsum(cal_p / calp_sum)
+
+        prices.flags.writeable = False
+        cdf.flags.writeable = False
+
+        if lut_vrbs:
+            print('\n\ncdf:', cdf)
+
+        return {'strat': strategy, 'dirn': dirn, 'pmin': pmin, 'pmax': pmax, 'prices': prices, 'cdf': cdf}
+
+    @staticmethod
+    def sample_price(strategy, t0, m, dirn, pmin, pmax, u):
+        """
+        Draw a price from the same distribution as calc_cdf_lut() gives, in O(log(pmax-pmin)) time and without
+        building a table.
+        The calligraphic-P values are (r^i - 1)/(e^c - 1) for i = 0..pmax-pmin with r = e^(c/(pmax-pmin)),
+        or 1 minus that, or the same with i counted down from the top of the range; their running totals are
+        geometric series, so the CDF at any price can be calculated directly, and the price with the CDF
+        value u is found by bisection on that: O(log(pmax-pmin)) rather than the O(pmax-pmin) of a new LUT.
+        (Solving for the price directly would need the Lambert W function.)
+        :param strategy: strategy-value in [-1,+1]
+        :param t0: constant used in the threshold function
+        :param m: constant used in the threshold function
+        :param dirn: direction: 'buy' or 'sell'
+        :param pmin: lower bound on discrete-valued price-range
+        :param pmax: upper bound on discrete-valued price-range
+        :param u: a draw from U(0,1).
+        :return: the lowest price whose cumulative probability is greater than u.
+        """
+
+        if (strategy > 1.0) or (strategy < -1.0):
+            # out of range
+            sys.exit('PRSH FAIL: strategy=%f out of range\n' % strategy)
+
+        if (dirn != 'buy') and (dirn != 'sell'):
+            # out of range
+            sys.exit('PRSH FAIL: bad dirn=%s\n' % dirn)
+
+        if pmax < pmin:
+            # screwed
+            sys.exit('PRSH FAIL: pmax %f < pmin %f \n' % (pmax, pmin))
+
+        p_range = pmax - pmin
+        if p_range < 1:
+            # special case: just the one price, as in calc_cdf_lut()
+            if dirn == 'buy':
+                return pmax
+            return pmin
+
+        if strategy == 0.0:
+            # special case: this is just ZIC
+            return pmin + min(int(u * (p_range + 1)), p_range)
+
+        c = TraderPRZI.calc_c(strategy, t0, m)
+        e2cm1 = math.expm1(c)
+        rm1 = math.expm1(c / p_range)
+
+        def gsum(n):
+            # sum of (r^i - 1)/(e^c - 1) for i = 0..n-1
+            return (math.expm1(c * n / p_range) / rm1 - n) / e2cm1
+
+        g_total = gsum(p_range + 1)
+
+        def cum(j):
+            # the (unnormalized) cumulative calligraphic-P up to & including the j'th price in the range
+            if dirn == 'buy':
+                cal_sum = gsum(j + 1)
+            else:
+                cal_sum = g_total - gsum(p_range - j)
+            if strategy < 0:
+                cal_sum = (j + 1) - cal_sum
+            return cal_sum
+
+        target = u * cum(p_range)
+        lo = 0
+        hi = p_range
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if cum(mid) > target:
+                hi = mid
+            else:
+                lo = mid + 1
+        return pmin + lo
+
+    @staticmethod
+    def cdf_lut(strategy, t0, m, dirn, pmin, pmax):
+        """
+        The CDF look-up table for these parameters, as given by calc_cdf_lut(): from the LRU cache shared by all
+        PRZI traders if it is there, otherwise calculated and added to the cache.
+        NB the tables are shared, so they must not be altered.
+        Parameters as for calc_cdf_lut().
+        :return: the LUT.
+        """
+        key = (strategy, t0, m, dirn, pmin, pmax)
+        lut = TraderPRZI.cdf_luts.get(key)
+        if lut is None:
+            lut = TraderPRZI.calc_cdf_lut(strategy, t0, m, dirn, pmin, pmax)
+            TraderPRZI.cdf_luts.put(key, lut)
+        return lut
 
     @staticmethod
     def strat_csv_str(strat):
@@ -816,15 +1981,15 @@ class TraderPRZI(Trader):
             sdev = 0.05
             newstrat = s
             while newstrat == s:
-                newstrat = s + random.gauss(0.0, sdev)
+                newstrat = s + self.rng.gauss(0.0, sdev)
                 # truncate to keep within range
                 newstrat = max(-1.0, min(1.0, newstrat))
         elif mode == 'uniform_whole_range':
             # draw uniformly from whole range
-            newstrat = random.uniform(-1.0, +1.0)
+            newstrat = self.rng.uniform(-1.0, +1.0)
         elif mode == 'uniform_bounded_range':
             # draw uniformly from bounded range
-            newstrat = random.uniform(s_min, s_max)
+            newstrat = self.rng.uniform(s_min, s_max)
         else:
             sys.exit('FAIL: bad mode in mutate_strat')
         return newstrat
@@ -834,7 +1999,7 @@ class TraderPRZI(Trader):
         Pretty-print a string summarising this trader's strategy/strategies
         :return: the string
         """
-        string = '%s: %s active_strat=[%d]:\n' % (self.tid, self.ttype, self.active_strat)
+        string = '%s: %s active_strat=[%d]:\n' % (self.tname, self.ttype, self.active_strat)
         for s in range(0, self.k):
             strat = self.strats[s]
             stratstr = '[%d]: s=%+f, start=%f, $=%f, pps=%f\n' % \
@@ -843,7 +2008,7 @@ class TraderPRZI(Trader):
 
         return string
 
-    def __init__(self, ttype, tid, balance, params, time):
+    def __init__(self, ttype, tid, balance, params, time, rng=None, tname=None):
         """
         Construct a PRZI trader
         :param ttype: the ticker-symbol for the type of trader (its strategy)
@@ -851,11 +2016,13 @@ class TraderPRZI(Trader):
         :param balance: the trader's bank balance
         :param params: if params == "landscape-mapper" then it generates data for mapping the fitness landscape
         :param time: the current time.
+        :param rng: the random-number generator this trader draws from; None => the random module.
+        :param tname: the trader's name, for output; None => str(tid).
         """
 
         vrbs = True
 
-        Trader.__init__(self, ttype, tid, balance, params, time)
+        Trader.__init__(self, ttype, tid, balance, params, time, rng, tname)
 
         # unpack the params
         # for all three of PRZI, PRSH, and PRDE params can include strat_min and strat_max
@@ -867,6 +2034,7 @@ class TraderPRZI(Trader):
         optimizer = None    # no optimizer => plain non-adaptive PRZI
         s_min = -1.0
         s_max = +1.0
+        sampler = 'lut'     # draw quote-prices from CDF look-up tables
 
         # did call provide different params?
         if type(params) is dict:
@@ -876,9 +2044,15 @@ class TraderPRZI(Trader):
                 optimizer = params['optimizer']
             s_min = params['strat_min']
             s_max = params['strat_max']
+            if 'sampler' in params:
+                sampler = params['sampler']
+
+        if sampler not in ('lut', 'closed_form'):
+            sys.exit('FAIL: bad PRZI sampler %s' % sampler)
 
         self.optmzr = optimizer     # this determines whether it's PRZI, PRSH, or PRDE
         self.k = k                  # number of sampling points (cf number of arms on a multi-armed-bandit, or pop-size)
+        self.sampler = sampler      # 'lut' => CDF look-up tables; 'closed_form' => TraderPRZI.sample_price()
         self.theta0 = 100           # threshold-function limit value
         self.m = 4                  # tangent-function multiplier
         self.strat_wait_time = 7200     # how many secs do we give any one strat before switching?
@@ -888,10 +2062,10 @@ class TraderPRZI(Trader):
         self.prev_qid = None        # previous order i.d.
         self.strat_eval_time = self.k * self.strat_wait_time   # time to cycle through evaluating all k strategies
         self.last_strat_change_time = time  # what time did we last change strategies?
-        self.profit_epsilon = 0.0 * random.random()    # min profit-per-sec difference between strategies that counts
+        self.profit_epsilon = 0.0 * self.rng.random()    # min profit-per-sec difference between strategies that counts
         self.strats = []            # strategies awaiting initialization
         self.pmax = None            # this trader's estimate of the maximum price the market will bear
-        self.pmax_c_i = math.sqrt(random.randint(1, 10))  # multiplier coefficient when estimating p_max
+        self.pmax_c_i = math.sqrt(self.rng.randint(1, 10))  # multiplier coefficient when estimating p_max
         self.mapper_outfile = None
         # differential evolution parameters all in one dictionary
         self.diffevol = {'de_state': 'active_s0',          # initial state: strategy 0 is active (being evaluated)
@@ -914,7 +2088,7 @@ class TraderPRZI(Trader):
             # for PRDE, use draws from uniform distbn over whole range and a (k+1)th strategy is needed to hold s_new
             strategy = None
             if s == 0:
-                strategy = random.uniform(self.strat_range_min, self.strat_range_max)
+                strategy = self.rng.uniform(self.strat_range_min, self.strat_range_max)
             else:
                 if self.optmzr == 'PRSH':
                     # simple stochastic hill climber: cluster other strats around strat_0
@@ -998,117 +2172,10 @@ class TraderPRZI(Trader):
             # print('shvr_p=%f; ' % shvr_p)
             return shvr_p
 
-        def calc_cdf_lut(strategy, t0, m, dirn, pmin, pmax):
-            """
-            calculate cumulative distribution function (CDF) look-up table (LUT)
-            :param strategy: strategy-value in [-1,+1]
-            :param t0: constant used in the threshold function
-            :param m: constant used in the threshold function
-            :param dirn: direction: 'buy' or 'sell'
-            :param pmin: lower bound on discrete-valued price-range
-            :param pmax: upper bound on discrete-valued price-range
-            :return: {'strat': strategy, 'dirn': dirn, 'pmin': pmin, 'pmax': pmax, 'cdf_lut': cdf}
-            """
-
-            # the threshold function used to clip
-            def threshold(theta0, x):
-                t = max(-1*theta0, min(theta0, x))
-                return t
-
-            epsilon = 0.000001  # used to catch DIV0 errors
-            lut_vrbs = False
-
-            if (strategy > 1.0) or (strategy < -1.0):
-                # out of range
-                sys.exit('PRSH FAIL: strategy=%f out of range\n' % strategy)
-
-            if (dirn != 'buy') and (dirn != 'sell'):
-                # out of range
-                sys.exit('PRSH FAIL: bad dirn=%s\n' % dirn)
-
-            if pmax < pmin:
-                # screwed
-                sys.exit('PRSH FAIL: pmax %f < pmin %f \n' % (pmax, pmin))
-
-            if lut_vrbs:
-                print('PRSH calc_cdf_lut: strategy=%f dirn=%d pmin=%d pmax=%d\n' % (strategy, dirn, pmin, pmax))
-
-            p_range = float(pmax - pmin)
-            if p_range < 1:
-                # special case: the SHVR-style strategy has shaved all the way to the limit price
-                # the lower and upper bounds on the interval are adjacent prices;
-                # so cdf is simply the limit-price with probability 1
-
-                if dirn == 'buy':
-                    cdf = [{'price': pmax, 'cum_prob': 1.0}]
-                else:   # must be a sell
-                    cdf = [{'price': pmin, 'cum_prob': 1.0}]
-
-                if lut_vrbs:
-                    print('\n\ncdf:', cdf)
-
-                return {'strat': strategy, 'dirn': dirn, 'pmin': pmin, 'pmax': pmax, 'cdf_lut': cdf}
-
-            c = threshold(t0, m * math.tan(math.pi * (strategy + 0.5)))
-
-            # catch div0 errors here
-            if abs(c) < epsilon:
-                if c > 0:
-                    c = epsilon
-                else:
-                    c = -epsilon
-
-            e2cm1 = math.exp(c) - 1
-
-            # calculate the discrete calligraphic-P function over interval [pmin, pmax]
-            # (i.e., this is Equation 8 in the PRZI Technical Note)
-            calp_interval = []
-            calp_sum = 0
-            for p in range(pmin, pmax + 1):
-                # normalize the price to proportion of its range
-                p_r = (p - pmin) / p_range  # p_r in [0.0, 1.0]
-                if strategy == 0.0:
-                    # special case: this is just ZIC
-                    cal_p = 1 / (p_range + 1)
-                elif strategy > 0:
-                    if dirn == 'buy':
-                        cal_p = (math.exp(c * p_r) - 1.0) / e2cm1
-                    else:   # dirn == 'sell'
-                        cal_p = (math.exp(c * (1 - p_r)) - 1.0) / e2cm1
-                else:   # self.strat < 0
-                    if dirn == 'buy':
-                        cal_p = 1.0 - ((math.exp(c * p_r) - 1.0) / e2cm1)
-                    else:   # dirn == 'sell'
-                        cal_p = 1.0 - ((math.exp(c * (1 - p_r)) - 1.0) / e2cm1)
-
-                if cal_p < 0:
-                    cal_p = 0   # just in case
-
-                calp_interval.append({'price': p, "cal_p": cal_p})
-                calp_sum += cal_p
-
-            if calp_sum <= 0:
-                print('calp_interval:', calp_interval)
-                print('pmin=%f, pmax=%f, calp_sum=%f' % (pmin, pmax, calp_sum))
-
-            cdf = []
-            cum_prob = 0
-            # now go thru interval summing and normalizing to give the CDF
-            for p in range(pmin, pmax + 1):
-                cal_p = calp_interval[p-pmin]['cal_p']
-                prob = cal_p / calp_sum
-                cum_prob += prob
-                cdf.append({'price': p, 'cum_prob': cum_prob})
-
-            if lut_vrbs:
-                print('\n\ncdf:', cdf)
-
-            return {'strat': strategy, 'dirn': dirn, 'pmin': pmin, 'pmax': pmax, 'cdf_lut': cdf}
-
         vrbs = False
 
         if vrbs:
-            print('t=%.1f PRSH getorder: %s, %s' % (time, self.tid, self.strat_str()))
+            print('t=%.1f PRSH getorder: %s, %s' % (time, self.tname, self.strat_str()))
 
         if len(self.orders) < 1:
             # no orders: return NULL
@@ -1143,12 +2210,10 @@ class TraderPRZI(Trader):
                     self.pmax = maxprice
 
             # use the cdf look-up table
-            # cdf_lut is a list of little dictionaries
-            # each dictionary has form: {'cum_prob':nnn, 'price':nnn}
+            # the lut holds an array of prices and an array of their cumulative probabilities
             # generate u=U(0,1) uniform disrtibution
-            # starting with the lowest nonzero cdf value at cdf_lut[0],
-            # walk up the lut (i.e., examine higher cumulative probabilities),
-            # until we're in the range of u; then return the relevant price
+            # binary-search the cumulative probabilities for the first one that is greater than u;
+            # then return the relevant price
 
             strat = self.strats[self.active_strat]['stratval']
 
@@ -1165,17 +2230,20 @@ class TraderPRZI(Trader):
                     # away from minprice and toward shvr_price
                     p_min = int(0.5 + (-strat * p_shvr) + ((1.0 + strat) * minprice))
 
-                lut_bid = self.strats[self.active_strat]['lut_bid']
+                dirn = 'buy'
 
-                if (lut_bid is None) or \
-                        (lut_bid['strat'] != strat) or (lut_bid['pmin'] != p_min) or (lut_bid['pmax'] != p_max):
-                    # need to compute a new LUT
-                    if vrbs:
-                        print('New bid LUT')
-                    self.strats[self.active_strat]['lut_bid'] = \
-                        calc_cdf_lut(strat, self.theta0, self.m, 'buy', p_min, p_max)
+                if self.sampler == 'lut':
+                    lut_bid = self.strats[self.active_strat]['lut_bid']
+
+                    if (lut_bid is None) or \
+                            (lut_bid['strat'] != strat) or (lut_bid['pmin'] != p_min) or (lut_bid['pmax'] != p_max):
+                        # need to compute a new LUT
+                        if vrbs:
+                            print('New bid LUT')
+                        self.strats[self.active_strat]['lut_bid'] = \
+                            TraderPRZI.cdf_lut(strat, self.theta0, self.m, 'buy', p_min, p_max)
 
-                lut = self.strats[self.active_strat]['lut_bid']
+                    lut = self.strats[self.active_strat]['lut_bid']
 
             else:   # otype == 'Ask'
 
@@ -1190,42 +2258,48 @@ class TraderPRZI(Trader):
                         # this should never happen, but just in case it does...
                         p_max = p_min
 
-                lut_ask = self.strats[self.active_strat]['lut_ask']
+                dirn = 'sell'
 
-                if (lut_ask is None) or \
-                        (lut_ask['strat'] != strat) or \
-                        (lut_ask['pmin'] != p_min) or \
-                        (lut_ask['pmax'] != p_max):
-                    # need to compute a new LUT
-                    if vrbs:
-                        print('New ask LUT')
-                    self.strats[self.active_strat]['lut_ask'] = \
-                        calc_cdf_lut(strat, self.theta0, self.m, 'sell', p_min, p_max)
+                if self.sampler == 'lut':
+                    lut_ask = self.strats[self.active_strat]['lut_ask']
+
+                    if (lut_ask is None) or \
+                            (lut_ask['strat'] != strat) or \
+                            (lut_ask['pmin'] != p_min) or \
+                            (lut_ask['pmax'] != p_max):
+                        # need to compute a new LUT
+                        if vrbs:
+                            print('New ask LUT')
+                        self.strats[self.active_strat]['lut_ask'] = \
+                            TraderPRZI.cdf_lut(strat, self.theta0, self.m, 'sell', p_min, p_max)
 
-                lut = self.strats[self.active_strat]['lut_ask']
+                    lut = self.strats[self.active_strat]['lut_ask']
 
             vrbs = False
-            if vrbs:
+            if vrbs and self.sampler == 'lut':
                 print('PRZI strat=%f LUT=%s \n \n' % (strat, lut))
                 # for debugging: print a table of lut: price and cum_prob, with the discrete derivative (gives PMF).
                 last_cprob = 0.0
-                for lut_entry in lut['cdf_lut']:
-                    cprob = lut_entry['cum_prob']
-                    print('%d, %f, %f' % (lut_entry['price'], cprob - last_cprob, cprob))
+                for price, cprob in zip(lut['prices'], lut['cdf']):
+                    print('%d, %f, %f' % (price, cprob - last_cprob, cprob))
                     last_cprob = cprob
                 print('\n')
                 
                 # print ('[LUT print suppressed]')
             
-            # do inverse lookup on the LUT to find the price
-            quoteprice = None
-            u = random.random()
-            for entry in lut['cdf_lut']:
-                if u < entry['cum_prob']:
-                    quoteprice = entry['price']
-                    break
+            u = self.rng.random()
+            if self.sampler == 'lut':
+                # do inverse lookup on the LUT to find the price
+                index = int(lut['cdf'].searchsorted(u, side='right'))
+                if index == len(lut['cdf']):
+                    # u is above the top of the cdf, which can only be rounding error in the cumulative sums
+                    index = index - 1
+                quoteprice = int(lut['prices'][index])
+            else:
+                # find the price directly, from the closed-form CDF
+                quoteprice = TraderPRZI.sample_price(strat, self.theta0, self.m, dirn, p_min, p_max, u)
 
-            order = Order(self.tid, otype, quoteprice, self.orders[0].qty, time, lob['QID'])
+            order = self.quote(otype, quoteprice, self.orders[0].qty, time, lob['QID'])
 
             self.lastquote = order
 
@@ -1334,7 +2408,7 @@ class TraderPRZI(Trader):
 
             if vrbs:
                 # print('t=%f %s PRSH respond: shc_algo=%s eval_t=%f max_wait_t=%f' %
-                #     (time, self.tid, shc_algo, self.strat_eval_time, self.strat_wait_time))
+                #     (time, self.tname, shc_algo, self.strat_eval_time, self.strat_wait_time))
                 pass
 
             # do we need to swap strategies?
@@ -1361,7 +2435,7 @@ class TraderPRZI(Trader):
                 if vrbs:
                     swt = self.strat_wait_time
                     print('t=%.3f (%.2fdays), %s PRSHrespond: strat[%d] elpsd=%.3f; wait_t=%.3f, pps=%f, new strat=%d' %
-                          (time, time/86400, self.tid, s, time_elapsed, swt, self.strats[s]['pps'], new_strat))
+                          (time, time/86400, self.tname, s, time_elapsed, swt, self.strats[s]['pps'], new_strat))
 
             # code below here deals with creating a new set of k-1 mutants from the best of the k strats
 
@@ -1381,7 +2455,7 @@ class TraderPRZI(Trader):
                 # strats_sorted = self.strats     # use this as a control: unsorts the strats, gives pure random walk.
 
                 if vrbs:
-                    print('PRSH %s: strat_eval_time=%f, all_old_enough=True' % (self.tid, self.strat_eval_time))
+                    print('PRSH %s: strat_eval_time=%f, all_old_enough=True' % (self.tname, self.strat_eval_time))
                     for s in strats_sorted:
                         print('s=%f, start_t=%f, lifetime=%f, $=%f, pps=%f' %
                               (s['stratval'], s['start_t'], time-s['start_t'], s['profit'], s['pps']))
@@ -1400,7 +2474,7 @@ class TraderPRZI(Trader):
                     prof_diff = strats_sorted[0]['pps'] - strats_sorted[1]['pps']
                     if abs(prof_diff) < self.profit_epsilon:
                         # they're too close to call, so just flip a coin
-                        best_strat = random.randint(0, 1)
+                        best_strat = self.rng.randint(0, 1)
 
                     if best_strat == 1:
                         # need to swap strats[0] and strats[1]
@@ -1426,7 +2500,7 @@ class TraderPRZI(Trader):
                     self.active_strat = 0
 
                 if vrbs:
-                    print('%s: strat_eval_time=%f, MUTATED:' % (self.tid, self.strat_eval_time))
+                    print('%s: strat_eval_time=%f, MUTATED:' % (self.tname, self.strat_eval_time))
                     for s in self.strats:
                         print('s=%f start_t=%f, lifetime=%f, $=%f, pps=%f' %
                               (s['stratval'], s['start_t'], time-s['start_t'], s['profit'], s['pps']))
@@ -1452,7 +2526,7 @@ class TraderPRZI(Trader):
                 elif self.diffevol['de_state'] == 'active_snew':
                     # now we've evaluated s_0 and s_new, so we can do DE adaptive step
                     if vrbs:
-                        print('PRDE trader %s' % self.tid)
+                        print('PRDE trader %s' % self.tname)
                     i_0 = self.diffevol['s0_index']
                     i_new = self.diffevol['snew_index']
                     fit_0 = self.strats[i_0]['pps']
@@ -1470,7 +2544,7 @@ class TraderPRZI(Trader):
 
                     # pick four individual strategies at random, but they must be distinct
                     stratlist = list(range(0, self.k))    # create sequential list of strategy-numbers
-                    random.shuffle(stratlist)             # shuffle the list
+                    self.rng.shuffle(stratlist)             # shuffle the list
 
                     # s0 is next iteration's candidate for possible replacement
                     self.diffevol['s0_index'] = stratlist[0]
@@ -1515,8 +2589,8 @@ class TraderPRZI(Trader):
                     if strat_stdev < 0.0001:
                         # this population has converged
                         # mutate one strategy at random
-                        randindex = random.randint(0, self.k - 1)
-                        self.strats[randindex]['stratval'] = random.uniform(-1.0, +1.0)
+                        randindex = self.rng.randint(0, self.k - 1)
+                        self.strats[randindex]['stratval'] = self.rng.uniform(-1.0, +1.0)
                         if verbose:
                             print('Converged pop: set strategy %d to %+f' %
                                   (randindex, self.strats[randindex]['stratval']))
@@ -1564,11 +2638,12 @@ class TraderZIP(Trader):
         return csv_str
 
     @staticmethod
-    def mutate_strat(s, mode):
+    def mutate_strat(s, mode, rng):
         """
         How to mutate the strategy values when evolving / hill-climbing
         :param s: the strategy to be mutated.
         :param mode: specify Gaussian or some other form of distribution for the mutation delta (currently only Gauss).
+        :param rng: the random-number generator to draw from.
         :return: the mutated strategy.
         """
 
@@ -1583,7 +2658,7 @@ class TraderZIP(Trader):
             """
             mut_val = value
             while mut_val == value:
-                mut_val = value + random.gauss(0.0, sdev)
+                mut_val = value + rng.gauss(0.0, sdev)
                 if mut_val > range_max:
                     mut_val = range_max
                 elif mut_val < range_min:
@@ -1606,17 +2681,19 @@ class TraderZIP(Trader):
             sys.exit('FAIL: bad mode in mutate_strat')
         return new_strat
 
-    def __init__(self, ttype, tid, balance, params, time):
+    def __init__(self, ttype, tid, balance, params, time, rng=None, tname=None):
         """
         Create a ZIP/ZIPSH/ZIPDE trader.
         :param ttype: the string identifying the trader-type (what strategy is this).
-        :param tid: the trader i.d. string.
+        :param tid: the trader i.d.
         :param balance: the starting bank balance for this trader.
         :param params: any additional parameters.
         :param time: the current time.
+        :param rng: the random-number generator this trader draws from; None => the random module.
+        :param tname: the trader's name, for output; None => str(tid).
         """
 
-        Trader.__init__(self, ttype, tid, balance, params, time)
+        Trader.__init__(self, ttype, tid, balance, params, time, rng, tname)
 
         # this set of one-liner functions named init_*() are just to make the init params obvious for ease of editing
         # for ZIP, a strategy is specified as a 6-tuple: (margin_buy, margin_sell, beta, momntm, ca, cr)
@@ -1624,29 +2701,29 @@ class TraderZIP(Trader):
 
         def init_beta():
             """in Cliff 1997 the initial beta values are U(0.1, 0.5)"""
-            return random.uniform(0.1, 0.5)
+            return self.rng.uniform(0.1, 0.5)
 
         def init_momntm():
             """in Cliff 1997 the initial momentum values are U(0.0, 0.1)"""
-            return random.uniform(0.0, 0.1)
+            return self.rng.uniform(0.0, 0.1)
 
         def init_ca():
             # in Cliff 1997 c_a was a system constant, the same for all traders, set to 0.05
             # here we take the liberty of introducing some variation
-            return random.uniform(0.01, 0.05)
+            return self.rng.uniform(0.01, 0.05)
 
         def init_cr():
             # in Cliff 1997 c_r was a system constant, the same for all traders, set to 0.05
             # here we take the liberty of introducing some variation
-            return random.uniform(0.01, 0.05)
+            return self.rng.uniform(0.01, 0.05)
 
         def init_margin():
             # in Cliff 1997 the initial margin values are U(0.05, 0.35)
-            return random.uniform(0.05, 0.35)
+            return self.rng.uniform(0.05, 0.35)
 
         def init_stratwaittime():
             # not in Cliff 1997: use whatever limits you think best.
-            return 7200 + random.randint(0, 3600)
+            return 7200 + self.rng.randint(0, 3600)
 
         # unpack the params
         # for ZIPSH and ZIPDE params should include values for optimizer and k
@@ -1666,7 +2743,7 @@ class TraderZIP(Trader):
             self.logfile = None
             if 'logfile' in params:
                 logging = True
-                logfilename = params['logfile'] + '_' + tid + '_log.csv'
+                logfilename = params['logfile'] + '_' + self.tname + '_log.csv'
                 self.logfile = open(logfilename, 'w')
 
         # the following set of variables are needed for original ZIP *and* for its optimizing extensions e.g. ZIPSH
@@ -1698,7 +2775,7 @@ class TraderZIP(Trader):
         self.strat_eval_time = self.k * self.strat_wait_time  # time to cycle through evaluating all k strategies
         self.last_strat_change_time = time  # what time did we last change strategies?
         self.active_strat = 0       # which of the k strategies are we currently playing? -- start with 0
-        self.profit_epsilon = 0.0 * random.random()     # min profit-per-sec difference between strategies that counts
+        self.profit_epsilon = 0.0 * self.rng.random()     # min profit-per-sec difference between strategies that counts
 
         if self.optmzr is not None and k > 1:
             # we're doing some form of k-armed strategy-optimization with multiple strategies
@@ -1718,10 +2795,14 @@ class TraderZIP(Trader):
 
         if self.logging:
             self.logfile.write('ZIP, Tid, %s, ttype, %s, optmzr, %s, strat_wait_time, %f, n_strats=%d:\n' %
-                               (self.tid, self.ttype, self.optmzr, self.strat_wait_time, self.k))
+                               (self.tname, self.ttype, self.optmzr, self.strat_wait_time, self.k))
             for s in self.strats:
                 self.logfile.write(str(s)+'\n')
 
+    def wants_poll(self):
+        """ as for Trader, but a ZIP trader that is still marked active needs a poll to switch itself off """
+        return len(self.orders) > 0 or self.active
+
     def getorder(self, time, countdown, lob):
         """
         Create the next order for this trader
@@ -1754,7 +2835,7 @@ class TraderZIP(Trader):
                 lastprice = self.lastquote.price
 
             self.price = quoteprice
-            order = Order(self.tid, self.job, quoteprice, self.orders[0].qty, time, lob['QID'])
+            order = self.quote(self.job, quoteprice, self.orders[0].qty, time, lob['QID'])
             self.lastquote = order
 
             if self.logging and order.price != lastprice:
@@ -1776,16 +2857,16 @@ class TraderZIP(Trader):
 
         def target_up(price):
             """ Generate a higher target price by randomly perturbing given price"""
-            ptrb_abs = self.ca * random.random()  # absolute shift
-            ptrb_rel = price * (1.0 + (self.cr * random.random()))  # relative shift
+            ptrb_abs = self.ca * self.rng.random()  # absolute shift
+            ptrb_rel = price * (1.0 + (self.cr * self.rng.random()))  # relative shift
             target = int(round(ptrb_rel + ptrb_abs, 0))
             # #                        print('TargetUp: %d %d\n' % (price,target))
             return target
 
         def target_down(price):
             """ Generate a lower target price by randomly perturbing given price"""
-            ptrb_abs = self.ca * random.random()  # absolute shift
-            ptrb_rel = price * (1.0 - (self.cr * random.random()))  # relative shift
+            ptrb_abs = self.ca * self.rng.random()  # absolute shift
+            ptrb_rel = price * (1.0 - (self.cr * self.rng.random()))  # relative shift
             target = int(round(ptrb_rel - ptrb_abs, 0))
             # #                        print('TargetDn: %d %d\n' % (price,target))
             return target
@@ -1886,8 +2967,8 @@ class TraderZIP(Trader):
                 # NB when the final strategy in the trader's set/popln is evaluated, the set is then sorted into
                 # descending order of profitability, so when we get to here we know that strats[0] is elite
 
-                if vrbs and self.tid == 'S00':
-                    print('t=%.3f, ZIPSH %s: strat_eval_time=%.3f,' % (time, self.tid, self.strat_eval_time))
+                if vrbs and self.tname == 'S00':
+                    print('t=%.3f, ZIPSH %s: strat_eval_time=%.3f,' % (time, self.tname, self.strat_eval_time))
                     for s in self.strats:
                         print('%s, start_t=%f, $=%f, pps=%f' %
                               (self.strat_csv_str(s['stratvec']), s['start_t'], s['profit'], s['pps']))
@@ -1898,7 +2979,7 @@ class TraderZIP(Trader):
                 prof_diff = self.strats[0]['pps'] - self.strats[1]['pps']
                 if abs(prof_diff) < self.profit_epsilon:
                     # they're too close to call, so just flip a coin
-                    best_strat = random.randint(0, 1)
+                    best_strat = self.rng.randint(0, 1)
 
                     if best_strat == 1:
                         # need to swap strats[0] and strats[1]
@@ -1910,7 +2991,7 @@ class TraderZIP(Trader):
 
                 # now replicate and mutate the elite into all the other strats
                 for s in range(1, self.k):  # note range index starts at one not zero (elite is at [0])
-                    self.strats[s]['stratvec'] = self.mutate_strat(self.strats[0]['stratvec'], 'gauss')
+                    self.strats[s]['stratvec'] = self.mutate_strat(self.strats[0]['stratvec'], 'gauss', self.rng)
                     strat_activate(time, s)
 
                 # and then update (wipe) records for the elite
@@ -1921,9 +3002,9 @@ class TraderZIP(Trader):
 
                 self.active_strat = 0
 
-                if vrbs and self.tid == 'S00':
+                if vrbs and self.tname == 'S00':
                     print('%s: strat_eval_time=%f, best_strat=%d, MUTATED:' %
-                          (self.tid, self.strat_eval_time, best_strat))
+                          (self.tname, self.strat_eval_time, best_strat))
                     for s in self.strats:
                         print('%s start_t=%.3f, lifetime=%.3f, $=%.3f, pps=%f' %
                               (self.strat_csv_str(s['stratvec']), s['start_t'], time - s['start_t'], s['profit'],
@@ -1966,8 +3047,8 @@ class TraderZIP(Trader):
                         self.strats[new_strat]['active'] = True
                         self.last_strat_change_time = time
 
-                    if vrbs and self.tid == 'S00':
-                        vstr = 't=%.3f (%.2fdays) %s ZIPSH respond:' % (time, time/86400, self.tid)
+                    if vrbs and self.tname == 'S00':
+                        vstr = 't=%.3f (%.2fdays) %s ZIPSH respond:' % (time, time/86400, self.tname)
                         vstr += ' strat[%d] elapsed=%.3f; wait_t=%.3f, pps=%f' % \
                                 (s, time_elapsed, self.strat_wait_time, self.strats[s]['pps'])
                         if new_strat > self.k - 1:
@@ -2109,7 +3190,9 @@ class TraderPT1(Trader):
     2.4.1.2    (put the money in my bank)
     """
 
-    def __init__(self, ttype, tid, balance, params, time):
+    orders_itself = True    # respond() creates the orders that it works
+
+    def __init__(self, ttype, tid, balance, params, time, rng=None, tname=None):
         """
         Construct a PT1 trader
         :param ttype: the ticker-symbol for the type of trader (its strategy)
@@ -2117,11 +3200,13 @@ class TraderPT1(Trader):
         :param balance: the trader's bank balance
         :param params: a dictionary of optional parameter-values to override the defaults
         :param time: the current time.
+        :param rng: the random-number generator this trader draws from; None => the random module.
+        :param tname: the trader's name, for output; None => str(tid).
         """
         
         init_verbose = True
         
-        Trader.__init__(self, ttype, tid, balance, params, time)
+        Trader.__init__(self, ttype, tid, balance, params, time, rng, tname)
         self.job = 'Buy'  # flag switches between 'Buy' & 'Sell'; shows what PT1 is currently trying to do
         self.last_purchase_price = None
 
@@ -2144,6 +3229,7 @@ class TraderPT1(Trader):
                 self.n_past_trades = int(round(params['n_past_trades']))
                 if self.n_past_trades < 1:
                     sys.exit('Fail: PT1 n_past trades must be 1 or more')
+        self.trade_sma_windows = (self.n_past_trades,)
                     
         if init_verbose:
             print('PT1 init: n_past_trades=%d, bid_percent=%6.5f, ask_delta=%d\n'
@@ -2165,11 +3251,7 @@ class TraderPT1(Trader):
             order = None
         else:
             quoteprice = self.orders[0].price
-            order = Order(self.tid,
-                          self.orders[0].otype,
-                          quoteprice,
-                          self.orders[0].qty,
-                          time, lob['QID'])
+            order = self.quote(self.orders[0].otype, quoteprice, self.orders[0].qty, time, lob['QID'])
             self.lastquote = order
         return order
 
@@ -2188,21 +3270,18 @@ class TraderPT1(Trader):
         vstr = 't=%f PT1 respond: ' % time
 
         # what is average price of most recent n trades?
+        # the exchange publishes a running average (see self.trade_sma_windows); if it doesn't have this one,
         # work backwards from end of tape (most recent trade)
-        tape_position = -1
-        n_prices = 0
-        sum_prices = 0
+        # NB the oldest item on the tape, tape[0], is never included
         avg_price_ok = False
         avg_price = -1
-        while n_prices < self.n_past_trades and abs(tape_position) < len(lob['tape']):
-            if lob['tape'][tape_position]['type'] == 'Trade':
-                price = lob['tape'][tape_position]['price']
-                n_prices += 1
-                sum_prices += price
-            tape_position -= 1
-        if n_prices == self.n_past_trades:
+        if self.n_past_trades in lob['trade_sma']:
+            sma = lob['trade_sma'][self.n_past_trades]
+        else:
+            sma = lob['tape'].sma(self.n_past_trades, 1)
+        if sma is not None:
             # there's been enough trades to form an acceptable average
-            avg_price = int(round(sum_prices / n_prices))
+            avg_price = int(round(sma))
             avg_price_ok = True
         vstr += "avg_price_ok=%s, avg_price=%d " % (avg_price_ok, avg_price)
 
@@ -2266,7 +3345,7 @@ class TraderPT1(Trader):
         secs = time - 60 * mins
         hrs = int(mins//60)
         mins = mins - 60 * hrs
-        outstr = 't=%f (%dh%02dm%02ds) %s (%s) bookkeep: orders=' % (time, hrs, mins, secs, self.tid, self.ttype)
+        outstr = 't=%f (%dh%02dm%02ds) %s (%s) bookkeep: orders=' % (time, hrs, mins, secs, self.tname, self.ttype)
         for order in self.orders:
             outstr = outstr + str(order)
 
@@ -2319,7 +3398,9 @@ class TraderPT2(Trader):
     2.4.1.2    (put the money in my bank)
     """
 
-    def __init__(self, ttype, tid, balance, params, time):
+    orders_itself = True    # respond() creates the orders that it works
+
+    def __init__(self, ttype, tid, balance, params, time, rng=None, tname=None):
         """
         Construct a PT2 trader
         :param ttype: the ticker-symbol for the type of trader (its strategy)
@@ -2327,9 +3408,11 @@ class TraderPT2(Trader):
         :param balance: the trader's bank balance
         :param params: a dictionary of optional parameter-values to override the defaults
         :param time: the current time.
+        :param rng: the random-number generator this trader draws from; None => the random module.
+        :param tname: the trader's name, for output; None => str(tid).
         """
 
-        Trader.__init__(self, ttype, tid, balance, params, time)
+        Trader.__init__(self, ttype, tid, balance, params, time, rng, tname)
         self.job = 'Buy'  # flag switches between 'Buy' & 'Sell'; shows what PT2 is currently trying to do
         self.last_purchase_price = None
         
@@ -2354,6 +3437,7 @@ class TraderPT2(Trader):
                 self.n_past_trades = int(round(params['n_past_trades']))
                 if self.n_past_trades < 1:
                     sys.exit('Fail: PT2 n_past trades must be 1 or more')
+        self.trade_sma_windows = (self.n_past_trades,)
                     
         if init_verbose:
             print('PT2 init: n_past_trades=%d, bid_percent=%6.5f, ask_delta=%d\n'
@@ -2375,11 +3459,7 @@ class TraderPT2(Trader):
             order = None
         else:
             quoteprice = self.orders[0].price
-            order = Order(self.tid,
-                          self.orders[0].otype,
-                          quoteprice,
-                          self.orders[0].qty,
-                          time, lob['QID'])
+            order = self.quote(self.orders[0].otype, quoteprice, self.orders[0].qty, time, lob['QID'])
             self.lastquote = order
         return order
 
@@ -2398,21 +3478,18 @@ class TraderPT2(Trader):
         vstr = 't=%f PT2 respond: ' % time
 
         # what is average price of most recent n trades?
+        # the exchange publishes a running average (see self.trade_sma_windows); if it doesn't have this one,
         # work backwards from end of tape (most recent trade)
-        tape_position = -1
-        n_prices = 0
-        sum_prices = 0
+        # NB the oldest item on the tape, tape[0], is never included
         avg_price_ok = False
         avg_price = -1
-        while n_prices < self.n_past_trades and abs(tape_position) < len(lob['tape']):
-            if lob['tape'][tape_position]['type'] == 'Trade':
-                price = lob['tape'][tape_position]['price']
-                n_prices += 1
-                sum_prices += price
-            tape_position -= 1
-        if n_prices == self.n_past_trades:
+        if self.n_past_trades in lob['trade_sma']:
+            sma = lob['trade_sma'][self.n_past_trades]
+        else:
+            sma = lob['tape'].sma(self.n_past_trades, 1)
+        if sma is not None:
             # there's been enough trades to form an acceptable average
-            avg_price = int(round(sum_prices / n_prices))
+            avg_price = int(round(sma))
             avg_price_ok = True
         vstr += "avg_price_ok=%s, avg_price=%d " % (avg_price_ok, avg_price)
 
@@ -2476,7 +3553,7 @@ class TraderPT2(Trader):
         secs = time - 60 * mins
         hrs = int(mins//60)
         mins = mins - 60 * hrs
-        outstr = 't=%f (%dh%02dm%02ds) %s (%s) bookkeep: orders=' % (time, hrs, mins, secs, self.tid, self.ttype)
+        outstr = 't=%f (%dh%02dm%02ds) %s (%s) bookkeep: orders=' % (time, hrs, mins, secs, self.tname, self.ttype)
         for order in self.orders:
             outstr = outstr + str(order)
 
@@ -2516,7 +3593,7 @@ def trade_stats(expid, traders, dumpfile, time, lob):
     Dump CSV statistics on exchange data and trader population to file for later analysis.
     This makes no assumptions about the number of types of traders, or the number of traders of any one type
     -- allows either/both to change between successive calls, but that does make it inefficient as it has to
-    re-analyse the entire set of traders on each call.
+    re-analyse the entire set of traders on each call. market_session() uses TradeStats instead, which doesn't.
     :param expid: the experiment-I.D. character-string.
     :param traders: the list of traders in the market.
     :param dumpfile: the file that will be written to.
@@ -2561,73 +3638,186 @@ def trade_stats(expid, traders, dumpfile, time, lob):
     dumpfile.write('\n')
 
 
-def populate_market(trdrs_spec, traders, shuffle, vrbs):
+class TradeStats:
+    """
+    Running per-trader-type totals of the traders' balances, for writing the same rows as trade_stats() does
+    without having to re-analyse the entire set of traders on every call.
+    Each trader added to it reports every change in its balance (see Trader.balance), so each row costs O(1)
+    in the number of traders. Rows are buffered and written to the file in blocks.
+    This assumes that the set of traders is fixed once they have been added, as it is within a market session.
+    """
+
+    def __init__(self, expid, dumpfile, buffer_rows=1000):
+        """
+        :param expid: the experiment-I.D. character-string.
+        :param dumpfile: the file that will be written to.
+        :param buffer_rows: how many rows to hold before writing them to the file.
+        """
+        self.expid = expid
+        self.dumpfile = dumpfile
+        self.buffer_rows = buffer_rows
+        self.buffer = []
+        self.trader_types = {}      # ttype => [number of traders of this type, sum of their balances]
+        self.ttypes = []            # the trader-types in sorted order, i.e. the column order
+
+    def add_trader(self, trader):
+        """ add a trader to the totals, and have it report its balance changes here from now on """
+        if trader.ttype not in self.trader_types:
+            self.trader_types[trader.ttype] = [0, 0]
+            self.ttypes = sorted(self.trader_types.keys())
+        self.trader_types[trader.ttype][0] += 1
+        self.trader_types[trader.ttype][1] += trader.balance
+        trader.stats = self
+
+    def balance_change(self, ttype, delta):
+        """ a trader of type ttype has had its balance changed by delta """
+        self.trader_types[ttype][1] += delta
+
+    def write(self, time, lob):
+        """
+        Add a row for the current time: in the same format as trade_stats().
+        :param time: the current time.
+        :param lob: the current state of the LOB.
+        :return: <nothing>
+        """
+        row = ['%s, %06d, ' % (self.expid, time)]
+        if lob['bids']['best'] is not None:
+            row.append('%d, ' % (lob['bids']['best']))
+        else:
+            row.append('None, ')
+        if lob['asks']['best'] is not None:
+            row.append('%d, ' % (lob['asks']['best']))
+        else:
+            row.append('None, ')
+        for ttype in self.ttypes:
+            n, s = self.trader_types[ttype]
+            row.append('%s, %d, %d, %f, ' % (ttype, s, n, s / float(n)))
+        row.append('\n')
+        self.buffer.append(''.join(row))
+        if len(self.buffer) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        """ write any buffered rows to the file """
+        self.dumpfile.write(''.join(self.buffer))
+        self.buffer = []
+
+
+def session_rng(seed, stream):
+    """
+    Return the random-number generator for one component of a market session.
+    Each component (the population, the customer orders, the session loop, each individual trader) gets its
+    own independent stream, seeded from the session seed and the stream's name, so what one component draws
+    doesn't depend on how many numbers any other component has drawn: that makes a seeded session reproducible
+    bit-for-bit, whatever order things happen in.
+    :param seed: the session seed; if None then the global random module is returned, as in older versions of BSE.
+    :param stream: character-string naming the component, e.g. 'orders' or 'trader-B07'.
+    :return: a random.Random instance, or the random module itself if seed is None.
+    """
+    if seed is None:
+        return random
+    return random.Random('%s-%s' % (seed, stream))
+
+
+def session_np_rng(seed, stream):
+    """
+    Return a numpy random Generator for one component of a market session: the numpy counterpart of session_rng().
+    :param seed: the session seed; if None then the Generator is seeded from the global random module.
+    :param stream: character-string naming the component.
+    :return: a numpy.random.Generator.
+    """
+    if seed is None:
+        return np.random.default_rng(random.getrandbits(128))
+    return np.random.default_rng(int.from_bytes(hashlib.sha256(('%s-%s' % (seed, stream)).encode()).digest(), 'little'))
+
+
+def trader_name(ttype_char, i, n):
+    """
+    The name of a trader, as used when printing or writing to files: e.g. the 8th of 20 buyers is B07.
+    The number is zero-padded to the same width for all n traders of the same kind (at least 2 digits).
+    :param ttype_char: the lead character of the name (B for buyer, S for seller, P for proptrader)
+    :param i: the index of this trader among the traders of its kind, counting from 0
+    :param n: how many traders of this kind
+    :return: the name string
+    """
+    return '%c%0*d' % (ttype_char, max(2, len(str(n - 1))), i)
+
+
+def populate_market(trdrs_spec, traders, shuffle, vrbs, seed=None):
     """
     Create a bunch of traders from traders-specification.
     Optionally shuffles the pack of buyers and the pack of sellers.
+    The traders' ids are integers, numbered from 0: the buyers first, then the sellers, then any proptraders;
+    each trader's name (its tname, for output) is made by trader_name(), e.g. B00, B01,... S00, S01,... P00,...
     :param trdrs_spec: the specification of the population of traders.
-    :param traders: the list into which the newly-created traders traders will be written, as a return parameter
+    :param traders: the dictionary into which the newly-created traders will be written, keyed by trader-id,
+            as a return parameter
     :param shuffle: whether to shuffle the ordering of buyers/sellers within the respective list.
     :param vrbs: verbosity Boolean: if True, print a running commentary; if False, stay silent.
+    :param seed: the session seed, from which the shuffling and each trader get their own stream (see session_rng).
     :return: tuple (n_buyers, n_sellers)
     """
     # trdrs_spec is a list of buyer-specs and a list of seller-specs
     # each spec is (<trader type>, <number of this type of trader>, optionally: <params for this type of trader>)
 
-    def trader_type(robottype, name, parameters):
+    def trader_type(robottype, tid, name, parameters):
         """
         Create a newly instantiated trader of the designated type.
         :param robottype: the 'ticker-symbol' abbreviation indicating what type of trader to create.
-        :param name: this trader's trader-I.D. character string.
+        :param tid: this trader's trader-I.D. integer.
+        :param name: this trader's name string.
         :param parameters: a list of parameter values for this trader-type.
         :return: a newly created trader of the designated type.
         """
         balance = 0.00
         proptrader_balance = 500  # marketmakers start with zero inventory and a balance of $500
         time0 = 0
+        rng = session_rng(seed, 'trader-' + name)
         if robottype == 'GVWY':
-            return TraderGiveaway('GVWY', name, balance, parameters, time0)
+            return TraderGiveaway('GVWY', tid, balance, parameters, time0, rng, name)
         elif robottype == 'ZIC':
-            return TraderZIC('ZIC', name, balance, parameters, time0)
+            return TraderZIC('ZIC', tid, balance, parameters, time0, rng, name)
         elif robottype == 'SHVR':
-            return TraderShaver('SHVR', name, balance, parameters, time0)
+            return TraderShaver('SHVR', tid, balance, parameters, time0, rng, name)
         elif robottype == 'SNPR':
-            return TraderSniper('SNPR', name, balance, parameters, time0)
+            return TraderSniper('SNPR', tid, balance, parameters, time0, rng, name)
         elif robottype == 'ZIP':
-            return TraderZIP('ZIP', name, balance, parameters, time0)
+            return TraderZIP('ZIP', tid, balance, parameters, time0, rng, name)
         elif robottype == 'ZIPSH':
-            return TraderZIP('ZIPSH', name, balance, parameters, time0)
+            return TraderZIP('ZIPSH', tid, balance, parameters, time0, rng, name)
         elif robottype == 'PRZI':
-            return TraderPRZI('PRZI', name, balance, parameters, time0)
+            return TraderPRZI('PRZI', tid, balance, parameters, time0, rng, name)
         elif robottype == 'PRSH':
-            return TraderPRZI('PRSH', name, balance, parameters, time0)
+            return TraderPRZI('PRSH', tid, balance, parameters, time0, rng, name)
         elif robottype == 'PRDE':
-            return TraderPRZI('PRDE', name, balance, parameters, time0)
+            return TraderPRZI('PRDE', tid, balance, parameters, time0, rng, name)
         elif robottype == 'PT1':
-            return TraderPT1('PT1', name, proptrader_balance, parameters, time0)
+            return TraderPT1('PT1', tid, proptrader_balance, parameters, time0, rng, name)
         elif robottype == 'PT2':
-            return TraderPT2('PT2', name, proptrader_balance, parameters, time0)
+            return TraderPT2('PT2', tid, proptrader_balance, parameters, time0, rng, name)
         else:
             sys.exit('FATAL: don\'t know trader type %s\n' % robottype)
 
-    def shuffle_traders(ttype_char, n, trader_list):
+    def shuffle_traders(first_tid, n, trader_list):
         """
-        Shuffles the trader-I.D. character strings of the traders in trader_list
-        :param ttype_char: the lead character on the trader-I.D. strings (B for buyer, S for seller, etc)
+        Shuffles the trader-I.D.s (and names) of the traders in trader_list with ids first_tid to first_tid+n-1
+        :param first_tid: the first trader-I.D. of this type (all the buyers, or all the sellers, etc)
         :param n: how many traders of this type
-        :param trader_list: the list of traders in which the shuffling happens
+        :param trader_list: the dictionary of traders in which the shuffling happens
         :return: <nothing>
         """
         for swap in range(n):
-            t1 = (n - 1) - swap
-            t2 = random.randint(0, t1)
-            t1name = '%c%02d' % (ttype_char, t1)
-            t2name = '%c%02d' % (ttype_char, t2)
-            trader_list[t1name].tid = t2name
-            trader_list[t2name].tid = t1name
-            temp = traders[t1name]
-            trader_list[t1name] = trader_list[t2name]
-            trader_list[t2name] = temp
+            t1 = first_tid + (n - 1) - swap
+            t2 = first_tid + shuffle_rng.randint(0, t1 - first_tid)
+            t1name = trader_list[t1].tname
+            t2name = trader_list[t2].tname
+            trader_list[t1].tid = t2
+            trader_list[t1].tname = t2name
+            trader_list[t2].tid = t1
+            trader_list[t2].tname = t1name
+            temp = trader_list[t1]
+            trader_list[t1] = trader_list[t2]
+            trader_list[t2] = temp
 
     def unpack_params(trader_params, mapping):
         """
@@ -2665,6 +3855,9 @@ def populate_market(trdrs_spec, traders, shuffle, vrbs):
                 else:   # ttype=PRZI
                     parameters = {'optimizer': None, 'k': 1,
                                   'strat_min': trader_params['s_min'], 'strat_max': trader_params['s_max']}
+                # optionally, how quote-prices are drawn: see TraderPRZI.__init__()
+                if 'sampler' in trader_params:
+                    parameters['sampler'] = trader_params['sampler']
             else:
                 sys.exit('FAIL: PRZI/PRSH/PRDE trader needs one or more parameters to be specified')
                 
@@ -2679,79 +3872,160 @@ def populate_market(trdrs_spec, traders, shuffle, vrbs):
 
     landscape_mapping = False   # set to true when mapping fitness landscape (for PRSH etc).
 
+    shuffle_rng = session_rng(seed, 'population')
+
+    proptrader_specs = []
+    if 'proptraders' in trdrs_spec:
+        proptrader_specs = trdrs_spec['proptraders']
+
     # the code that follows is a bit of a kludge, needs tidying up.
     n_buyers = 0
+    n_buyers_spec = sum([bs[1] for bs in trdrs_spec['buyers']])
     for bs in trdrs_spec['buyers']:
         ttype = bs[0]
         for b in range(bs[1]):
-            tname = 'B%02d' % n_buyers  # buyer i.d. string
+            tid = n_buyers
+            tname = trader_name('B', n_buyers, n_buyers_spec)    # buyer name string
             if len(bs) > 2:
                 # third part of the buyer-spec is params for this trader-type
                 params = unpack_params(bs[2], landscape_mapping)
             else:
                 params = unpack_params(None, landscape_mapping)
-            traders[tname] = trader_type(ttype, tname, params)
+            traders[tid] = trader_type(ttype, tid, tname, params)
             n_buyers = n_buyers + 1
 
     if n_buyers < 1:
         sys.exit('FATAL: no buyers specified\n')
 
     if shuffle:
-        shuffle_traders('B', n_buyers, traders)
+        shuffle_traders(0, n_buyers, traders)
 
     n_sellers = 0
+    n_sellers_spec = sum([ss[1] for ss in trdrs_spec['sellers']])
     for ss in trdrs_spec['sellers']:
         ttype = ss[0]
         for s in range(ss[1]):
-            tname = 'S%02d' % n_sellers  # buyer i.d. string
+            tid = n_buyers + n_sellers
+            tname = trader_name('S', n_sellers, n_sellers_spec)  # seller name string
             if len(ss) > 2:
                 # third part of the buyer-spec is params for this trader-type
                 params = unpack_params(ss[2], landscape_mapping)
             else:
                 params = unpack_params(None, landscape_mapping)
-            traders[tname] = trader_type(ttype, tname, params)
+            traders[tid] = trader_type(ttype, tid, tname, params)
             n_sellers = n_sellers + 1
 
     if n_sellers < 1:
         sys.exit('FATAL: no sellers specified\n')
 
     if shuffle:
-        shuffle_traders('S', n_sellers, traders)
+        shuffle_traders(n_buyers, n_sellers, traders)
 
     n_proptraders = 0
-    if 'proptraders' in trdrs_spec and len(trdrs_spec['proptraders']) > 0:
-        for pts in trdrs_spec['proptraders']:
-            ttype = pts[0]
-            for pt in range(pts[1]):
-                tname = 'P%02d' % n_proptraders  # proptrader i.d. string
-                if len(pts) > 2:
-                    # third part of the buyer-spec is params for this trader-type
-                    params = unpack_params(pts[2], landscape_mapping)
-                else:
-                    params = unpack_params(None, landscape_mapping)
-                traders[tname] = trader_type(ttype, tname, params)
-                n_proptraders = n_proptraders + 1
+    n_proptraders_spec = sum([pts[1] for pts in proptrader_specs])
+    for pts in proptrader_specs:
+        ttype = pts[0]
+        for pt in range(pts[1]):
+            tid = n_buyers + n_sellers + n_proptraders
+            tname = trader_name('P', n_proptraders, n_proptraders_spec)     # proptrader name string
+            if len(pts) > 2:
+                # third part of the buyer-spec is params for this trader-type
+                params = unpack_params(pts[2], landscape_mapping)
+            else:
+                params = unpack_params(None, landscape_mapping)
+            traders[tid] = trader_type(ttype, tid, tname, params)
+            n_proptraders = n_proptraders + 1
 
     # NB markets with zero proptraders don't cause a fatal error
 
     if n_proptraders > 0 and shuffle:
-        shuffle_traders('P', n_proptraders, traders)
+        shuffle_traders(n_buyers + n_sellers, n_proptraders, traders)
 
     if vrbs:
-        for t in range(n_buyers):
-            tname = 'B%02d' % t
-            print(traders[tname])
-        for t in range(n_sellers):
-            tname = 'S%02d' % t
-            print(traders[tname])
-        for t in range(n_proptraders):
-            tname = 'P%02d' % t
-            print(traders[tname])
+        for tid in range(n_buyers + n_sellers + n_proptraders):
+            print(traders[tid])
 
     return {'n_buyers': n_buyers, 'n_sellers': n_sellers, 'n_proptraders': n_proptraders}
 
 
-def customer_orders(time, traders, trader_stats, orders_sched, pending, vrbs):
+class CustomerOrderQueue:
+    """
+    The customer orders that have been generated but not yet issued to traders, held in a heap ordered by
+    issue time so that the orders that are due can be popped without scanning the whole queue.
+    Orders that fall due together are issued in the order they were pushed, as with the original pending list.
+    A whole batch of orders can also be pushed as arrays (see push_batch()): the Order objects for a batch
+    are only created as they fall due.
+    """
+
+    def __init__(self):
+        self.heap = []      # items are (issue time, push sequence-number, order)
+        self.n_pushed = 0
+        # each batch is [issue times (sorted), push sequence-numbers, trader-ids, order type, prices, next index]
+        self.batches = []
+        self.n_batched = 0  # number of orders in batches not yet popped
+
+    def push(self, order):
+        """ add a customer order, to be issued once the time is later than order.time """
+        heapq.heappush(self.heap, (order.time, self.n_pushed, order))
+        self.n_pushed += 1
+
+    def push_batch(self, tids, otype, prices, times):
+        """
+        Add a batch of customer orders, all of the same type, each to be issued once the time is later than its
+        issue time: equivalent to pushing them one at a time, in the sequence given.
+        :param tids: list of the trader-ids the orders are for.
+        :param otype: the order type, 'Bid' or 'Ask'.
+        :param prices: numpy array of the orders' prices.
+        :param times: numpy array of the orders' issue times.
+        :return: <nothing>
+        """
+        n = len(tids)
+        if n < 1:
+            return
+        by_time = np.argsort(times, kind='stable')
+        self.batches.append([times[by_time].tolist(), (by_time + self.n_pushed).tolist(),
+                             [tids[i] for i in by_time], otype, prices[by_time].tolist(), 0])
+        self.n_pushed += n
+        self.n_batched += n
+
+    def pop_due(self, time):
+        """
+        Remove and return the orders that are due, i.e. whose issue time is earlier than the given time.
+        :param time: the current time.
+        :return: list of orders, in the sequence they were pushed.
+        """
+        due = []
+        heap = self.heap
+        while len(heap) > 0 and heap[0][0] < time:
+            due.append(heapq.heappop(heap))
+        if len(self.batches) > 0:
+            for batch in self.batches:
+                [times, seqs, tids, otype, prices, start] = batch
+                end = bisect.bisect_left(times, time, start)
+                for i in range(start, end):
+                    due.append((times[i], seqs[i], Order(tids[i], otype, prices[i], 1, times[i], chrono.time())))
+                self.n_batched -= end - start
+                batch[5] = end
+            self.batches = [batch for batch in self.batches if batch[5] < len(batch[0])]
+        due.sort(key=lambda item: item[1])
+        return [item[2] for item in due]
+
+    def next_issue_time(self):
+        """ the issue time of the next order to fall due, or None if the queue is empty """
+        next_time = None
+        if len(self.heap) > 0:
+            next_time = self.heap[0][0]
+        for batch in self.batches:
+            if next_time is None or batch[0][batch[5]] < next_time:
+                next_time = batch[0][batch[5]]
+        return next_time
+
+    def __len__(self):
+        return len(self.heap) + self.n_batched
+
+
+def customer_orders(time, traders, trader_stats, orders_sched, pending, vrbs, issued=None, rng=None,
+                    batch_rng=None):
     """
     Generate a list of new customer-orders to be issued to the traders in the immediate/near future,
     and a list of any existing customer-orders that need to be cancelled because they are overridden by new ones.
@@ -2772,10 +4046,14 @@ def customer_orders(time, traders, trader_stats, orders_sched, pending, vrbs):
             if len(range)==4, the third value is function that gives dynamic offset for schedule min, and 4th is a
             function giving dynamic offset for schedule max, so gradient of sup/dem linear curve can vary dynamically
             along with the varying equilibrium price.
-    :param pending: the list of currently pending future orders if this is empty, generates a new one).
+    :param pending: CustomerOrderQueue of currently pending future orders (if this is empty, generates a new batch).
     :param vrbs: verbosity Boolean: if True, print a running commentary; if False, stay silent.
-    :return: [new_pending, cancellations]:
-            new_pending is list of new orders to be issued;
+    :param issued: if not None, a list that the trader-id of each trader issued with an order is appended to.
+    :param rng: the random-number generator that order prices and times are drawn from; None => the random module.
+    :param batch_rng: if not None, a numpy random Generator: each side's issue times and prices are then generated
+            as arrays in one go, drawing from batch_rng rather than rng, and the orders pushed onto pending as a batch.
+    :return: [pending, cancellations]:
+            pending is the CustomerOrderQueue of orders still to be issued (NB this is updated in place);
             cancellations is list of previously-issued orders now cancelled.
     """
 
@@ -2837,14 +4115,14 @@ def customer_orders(time, traders, trader_stats, orders_sched, pending, vrbs):
         if stepmode == 'fixed':
             order_price = pmin + int(i * stepsize)
         elif stepmode == 'jittered':
-            order_price = pmin + int(i * stepsize) + random.randint(-halfstep, halfstep)
+            order_price = pmin + int(i * stepsize) + rng.randint(-halfstep, halfstep)
         elif stepmode == 'random':
             if len(schedules) > 1:
                 # more than one schedule: choose one equiprobably
-                s = random.randint(0, len(schedules) - 1)
+                s = rng.randint(0, len(schedules) - 1)
                 pmin = sysmin_check(min(schedules[s][0], schedules[s][1]))
                 pmax = sysmax_check(max(schedules[s][0], schedules[s][1]))
-            order_price = random.randint(int(pmin), int(pmax))
+            order_price = rng.randint(int(pmin), int(pmax))
         else:
             sys.exit('FAIL: Unknown mode in schedule')
         order_price = sysmin_check(sysmax_check(order_price))
@@ -2879,10 +4157,10 @@ def customer_orders(time, traders, trader_stats, orders_sched, pending, vrbs):
             elif timemode == 'drip-fixed':
                 arrtime = trdr * tstep
             elif timemode == 'drip-jitter':
-                arrtime = trdr * tstep + tstep * random.random()
+                arrtime = trdr * tstep + tstep * rng.random()
             elif timemode == 'drip-poisson':
                 # poisson requires a bit of extra work
-                interarrivaltime = random.expovariate(n_traders / interval)
+                interarrivaltime = rng.expovariate(n_traders / interval)
                 arrtime += interarrivaltime
             else:
                 sys.exit('FAIL: unknown time-mode in getissuetimes()')
@@ -2898,7 +4176,7 @@ def customer_orders(time, traders, trader_stats, orders_sched, pending, vrbs):
         if shuffle:
             for trdr in range(n_traders):
                 i = (n_traders - 1) - trdr
-                j = random.randint(0, i)
+                j = rng.randint(0, i)
                 tmp = issue_times[i]
                 issue_times[i] = issue_times[j]
                 issue_times[j] = tmp
@@ -2925,6 +4203,100 @@ def customer_orders(time, traders, trader_stats, orders_sched, pending, vrbs):
             sys.exit('Fail: time=%5.2f not within any timezone in order_schedules=%s' % (t_now, order_schedules))
         return schedrange, stepmode
 
+    def getissuetimes_batch(n_traders, timemode, interval, fittointerval):
+        """
+        Array version of getissuetimes(), drawing from batch_rng: the issue times are always shuffled.
+        :param n_traders: how many traders need issue times.
+        :param timemode: character-string specifying the temporal spacing of orders, as in getissuetimes().
+        :param interval: the time-interval between successive order issuals/arrivals.
+        :param fittointerval: if True then final order arrives at exactly t+interval; else may be slightly later.
+        :return: numpy array of the issue times.
+        """
+        interval = float(interval)
+        if n_traders < 1:
+            sys.exit('FAIL: n_traders < 1 in getissuetimes_batch()')
+        elif n_traders == 1:
+            tstep = interval
+        else:
+            tstep = interval / (n_traders - 1)
+        if timemode == 'periodic':
+            issue_times = np.full(n_traders, interval)
+        elif timemode == 'drip-fixed':
+            issue_times = np.arange(n_traders) * tstep
+        elif timemode == 'drip-jitter':
+            issue_times = np.arange(n_traders) * tstep + tstep * batch_rng.random(n_traders)
+        elif timemode == 'drip-poisson':
+            issue_times = np.cumsum(batch_rng.exponential(interval / n_traders, n_traders))
+        else:
+            sys.exit('FAIL: unknown time-mode in getissuetimes_batch()')
+        arrtime = issue_times[-1]
+        if fittointerval and arrtime != interval:
+            issue_times = interval * (issue_times / arrtime)
+        return batch_rng.permutation(issue_times)
+
+    def getorderprices_batch(schedules, n, stepmode, orderissuetimes):
+        """
+        Array version of getorderprice(), generating the prices for all n traders in one go, drawing from batch_rng.
+        If an offset function has an offsets() method (as OffsetEventList does) then that is used to get all the
+        offsets at once; otherwise the offset function is called once per order.
+        :param schedules: the supply/demand schedules.
+        :param n: the number of traders that this schedule sup/dem is being applied to.
+        :param stepmode: what type of steps to have between successive prices on the sup/dem schedule.
+        :param orderissuetimes: numpy array of the times that the orders will be issued at.
+        :return: numpy array of the (integer) prices.
+        """
+
+        def offsets(fn, params):
+            if hasattr(fn, 'offsets'):
+                return np.asarray(fn.offsets(orderissuetimes), dtype=np.float64)
+            return np.array([fn(t, *params) for t in orderissuetimes.tolist()], dtype=np.float64)
+
+        if len(schedules[0]) > 2:
+            offsetfn = schedules[0][2]
+            if callable(offsetfn[0]):
+                offset_min = offsets(offsetfn[0], offsetfn[1])
+                offset_max = offset_min
+            else:
+                sys.exit('FAIL: 3rd argument of sched in getorderprices_batch() not callable')
+            if len(schedules[0]) > 3:
+                offsetfn = schedules[0][3]
+                if callable(offsetfn):
+                    offset_max = offsets(offsetfn, [])
+                else:
+                    sys.exit('FAIL: 4th argument of sched in getorderprices_batch() not callable')
+        else:
+            offset_min = np.zeros(n)
+            offset_max = offset_min
+
+        pmin = np.maximum(offset_min + min(schedules[0][0], schedules[0][1]), bse_sys_minprice)
+        pmax = np.minimum(offset_max + max(schedules[0][0], schedules[0][1]), bse_sys_maxprice)
+        stepsize = (pmax - pmin) / max(n - 1, 1)
+        halfstep = np.rint(stepsize / 2.0).astype(np.int64)
+        steps = np.trunc(np.arange(n) * stepsize)
+
+        if stepmode == 'fixed':
+            order_prices = pmin + steps
+        elif stepmode == 'jittered':
+            order_prices = pmin + steps + batch_rng.integers(-halfstep, halfstep, endpoint=True)
+        elif stepmode == 'random':
+            if len(schedules) > 1:
+                # more than one schedule: choose one equiprobably for each order
+                s = batch_rng.integers(0, len(schedules), n)
+                pmin = np.maximum([min(schedules[k][0], schedules[k][1]) for k in s], bse_sys_minprice)
+                pmax = np.minimum([max(schedules[k][0], schedules[k][1]) for k in s], bse_sys_maxprice)
+            order_prices = batch_rng.integers(np.trunc(pmin).astype(np.int64), np.trunc(pmax).astype(np.int64),
+                                              endpoint=True)
+        else:
+            sys.exit('FAIL: Unknown mode in schedule')
+        if np.any(order_prices < bse_sys_minprice) or np.any(order_prices > bse_sys_maxprice):
+            print('WARNING: price outside [bse_sys_min, bse_sys_max] -- clipped')
+            order_prices = np.clip(order_prices, bse_sys_minprice, bse_sys_maxprice)
+        # prices are always whole numbers of cents/pennies
+        return np.rint(order_prices).astype(np.int64)
+
+    if rng is None:
+        rng = random
+
     n_buyers = trader_stats['n_buyers']
     n_sellers = trader_stats['n_sellers']
 
@@ -2932,9 +4304,16 @@ def customer_orders(time, traders, trader_stats, orders_sched, pending, vrbs):
 
     cancellations = []
 
-    if len(pending) < 1:
-        # list of pending (to-be-issued) customer orders is empty, so generate a new one
-        new_pending = []
+    if len(pending) < 1 and batch_rng is not None:
+        # queue of pending (to-be-issued) customer orders is empty, so generate a new batch, as arrays
+        for (n, first_tid, ordertype, sched_key) in ((n_buyers, 0, 'Bid', 'dem'), (n_sellers, n_buyers, 'Ask', 'sup')):
+            issuetimes = time + getissuetimes_batch(n, orders_sched['timemode'], orders_sched['interval'], True)
+            (sched, mode) = getschedmode(time, orders_sched[sched_key])
+            orderprices = getorderprices_batch(sched, n, mode, issuetimes)
+            pending.push_batch(list(range(first_tid, first_tid + n)), ordertype, orderprices, issuetimes)
+
+    elif len(pending) < 1:
+        # queue of pending (to-be-issued) customer orders is empty, so generate a new batch
 
         # demand side (buyers)
         issuetimes = getissuetimes(n_buyers, orders_sched['timemode'], orders_sched['interval'], shuffle_times, True)
@@ -2943,10 +4322,10 @@ def customer_orders(time, traders, trader_stats, orders_sched, pending, vrbs):
         (sched, mode) = getschedmode(time, orders_sched['dem'])
         for t in range(n_buyers):
             issuetime = time + issuetimes[t]
-            tname = 'B%02d' % t
+            tid = t
             orderprice = getorderprice(t, sched, n_buyers, mode, issuetime)
-            order = Order(tname, ordertype, orderprice, 1, issuetime, chrono.time())
-            new_pending.append(order)
+            order = Order(tid, ordertype, orderprice, 1, issuetime, chrono.time())
+            pending.push(order)
 
         # supply side (sellers)
         issuetimes = getissuetimes(n_sellers, orders_sched['timemode'], orders_sched['interval'], shuffle_times, True)
@@ -2954,34 +4333,32 @@ def customer_orders(time, traders, trader_stats, orders_sched, pending, vrbs):
         (sched, mode) = getschedmode(time, orders_sched['sup'])
         for t in range(n_sellers):
             issuetime = time + issuetimes[t]
-            tname = 'S%02d' % t
+            tid = n_buyers + t
             orderprice = getorderprice(t, sched, n_sellers, mode, issuetime)
             # print('time %d sellerprice %d' % (time,orderprice))
-            order = Order(tname, ordertype, orderprice, 1, issuetime, chrono.time())
-            new_pending.append(order)
+            order = Order(tid, ordertype, orderprice, 1, issuetime, chrono.time())
+            pending.push(order)
     else:
         # there are pending future orders: issue any whose timestamp is in the past
-        new_pending = []
-        for order in pending:
-            if order.time < time:
-                # this order should have been issued by now
-                # issue it to the trader
-                tname = order.tid
-                response = traders[tname].add_order(order, vrbs)
+        for order in pending.pop_due(time):
+            # this order should have been issued by now
+            # issue it to the trader
+            tid = order.tid
+            response = traders[tid].add_order(order, vrbs)
+            if issued is not None:
+                issued.append(tid)
+            if vrbs:
+                print('Customer order: %s %s' % (response, order))
+            if response == 'LOB_Cancel':
+                cancellations.append(tid)
                 if vrbs:
-                    print('Customer order: %s %s' % (response, order))
-                if response == 'LOB_Cancel':
-                    cancellations.append(tname)
-                    if vrbs:
-                        print('Cancellations: %s' % cancellations)
-                # and then don't add it to new_pending (i.e., delete it)
-            else:
-                # this order stays on the pending list
-                new_pending.append(order)
-    return [new_pending, cancellations]
+                    print('Cancellations: %s' % cancellations)
+    return [pending, cancellations]
 
 
-def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dumpfile_flags, sess_vrbs):
+def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dumpfile_flags, sess_vrbs,
+                   lob_impl='levels', lob_format='csv', scheduler='poll', seed=None, order_gen='loop',
+                   skip_requotes=False):
     """
     One session in the market.
     :param sess_id: the character-string ID for this session, used in naming output files.
@@ -2991,7 +4368,23 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
     :param order_schedule: specification of the "customer orders" assigned to traders, i.e. the supply/demand schedule.
     :param dumpfile_flags: a dictionary of Boolean flags specifying which output files to be written for this session.
     :param sess_vrbs: verbosity: if True, output a running commentary on what is going on; if False, stay silent.
-    :return: <nothing>.
+    :param lob_impl: which orderbook implementation the exchange uses: 'levels' or 'ticks' (see Orderbook).
+    :param lob_format: file format for the LOB frames if dumpfile_flags['dump_lobs']: 'csv', 'binary' or 'delta'.
+    :param scheduler: 'poll' => the original loop that steps through every timestep, polling one random trader
+            at each; 'event' => event-driven main loop that skips over timesteps where nothing can happen, which is
+            much quicker for long sessions but draws different random numbers, so for the same seed the results
+            are the same only statistically.
+    :param seed: the session seed: if not None, the traders, the customer orders, and the session loop each
+            draw from their own random-number stream seeded from this (see session_rng), so the session is
+            reproducible bit-for-bit; if None, everything draws from the global random module.
+    :param order_gen: how customer orders are generated: 'loop' => one at a time, as they always have been;
+            'batch' => all the orders for each side at once, as numpy arrays (see customer_orders()), which is
+            much quicker when there are many traders.
+    :param skip_requotes: if True, a quote identical to the one the trader already has resting on the LOB is not
+            sent to the exchange (and so the traders are not asked to respond to it); if False, it is sent and
+            overwrites the resting order, as it always has been, which gives it a fresh time and quote i.d.
+    :return: summary of the traders' final balances: dictionary, for each trader-type, of
+            {'n': number of traders of that type, 'balance_sum': their total balance}.
     """
 
     def dump_strats_frame(frametime, stratfile, trdrs):
@@ -3018,7 +4411,7 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
 
             # print('PRSH/PRDE/ZIPSH strategy recording, t=%s' % trader)
             if trader.ttype == 'PRSH' or trader.ttype == 'PRDE' or trader.ttype == 'ZIPSH':
-                line_str += 'id=,%s, %s,' % (trader.tid, trader.ttype)
+                line_str += 'id=,%s, %s,' % (trader.tname, trader.ttype)
 
                 if trader.ttype == 'ZIPSH':
                     # we know that ZIPSH sorts the set of strats into best-first
@@ -3031,13 +4424,13 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
                 line_str += 'actvstrat=,%s ' % trader.strat_csv_str(act_strat)
                 line_str += 'actvprof=,%f, ' % act_prof
 
-                if trader.tid[:1] == 'B':
+                if trader.tid < trader_stats['n_buyers']:
                     # this trader is a buyer
                     if best_buyer_id is None or act_prof > best_buyer_prof:
                         best_buyer_id = trader.tid
                         best_buyer_strat = act_strat
                         best_buyer_prof = act_prof
-                elif trader.tid[:1] == 'S':
+                elif trader.tid < trader_stats['n_buyers'] + trader_stats['n_sellers']:
                     # this trader is a seller
                     if best_seller_id is None or act_prof > best_seller_prof:
                         best_seller_id = trader.tid
@@ -3048,11 +4441,13 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
                     sys.exit('unknown trader id type in market_session')
 
         if best_buyer_id is not None:
-            line_str += 'best_B_id=,%s, best_B_prof=,%f, best_B_strat=, ' % (best_buyer_id, best_buyer_prof)
+            line_str += 'best_B_id=,%s, best_B_prof=,%f, best_B_strat=, ' % (traders[best_buyer_id].tname,
+                                                                              best_buyer_prof)
             line_str += traders[best_buyer_id].strat_csv_str(best_buyer_strat)
 
         if best_seller_id is not None:
-            line_str += 'best_S_id=,%s, best_S_prof=,%f, best_S_strat=, ' % (best_seller_id, best_seller_prof)
+            line_str += 'best_S_id=,%s, best_S_prof=,%f, best_S_strat=, ' % (traders[best_seller_id].tname,
+                                                                              best_seller_prof)
             line_str += traders[best_seller_id].strat_csv_str(best_seller_strat)
 
         line_str += '\n'
@@ -3072,10 +4467,11 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
         """
         bdump = open(session_id+'_blotters.csv', 'w')
         for trdr in trdrs:
-            bdump.write('%s, %d\n' % (trdrs[trdr].tid, len(trdrs[trdr].blotter)))
+            bdump.write('%s, %d\n' % (trdrs[trdr].tname, len(trdrs[trdr].blotter)))
             for b in trdrs[trdr].blotter:
                 bdump.write('%s, %s, %.3f, %d, %s, %s, %d\n'
-                            % (traders[trdr].tid, b['type'], b['time'], b['price'], b['party1'], b['party2'], b['qty']))
+                            % (trdrs[trdr].tname, b['type'], b['time'], b['price'],
+                               trdrs[b['party1']].tname, trdrs[b['party2']].tname, b['qty']))
         bdump.close()
 
     orders_verbose = False
@@ -3093,7 +4489,7 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
         strat_dump = None
 
     if dumpfile_flags['dump_lobs']:
-        lobframes = open(output_path + sess_id + '_LOB_frames.csv', 'w')
+        lobframes = LOBFrameWriter(output_path + sess_id + '_LOB_frames', lob_format)
     else:
         lobframes = None
 
@@ -3109,11 +4505,28 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
         tape_dump = None
         
     # initialise the exchange
-    exchange = Exchange()
+    exchange = Exchange(lob_impl)
 
     # create a bunch of traders
     traders = {}
-    trader_stats = populate_market(trader_spec, traders, True, populate_verbose)
+    trader_stats = populate_market(trader_spec, traders, True, populate_verbose, seed)
+
+    # running totals of balance per trader-type, for the avg_balance file
+    if dumpfile_flags['dump_avgbals']:
+        avg_bal_stats = TradeStats(sess_id, avg_bals)
+        for t in traders:
+            avg_bal_stats.add_trader(traders[t])
+    else:
+        avg_bal_stats = None
+
+    # the moving averages of trade prices that the traders want the exchange to publish
+    for t in traders:
+        for n in traders[t].trade_sma_windows:
+            exchange.tape.register_sma(n)
+
+    # the traders that need to respond to every event on the exchange (see Trader.needs_respond)
+    responders = [t for t in traders if traders[t].needs_respond]
+    last_respond_time = None
 
     # timestep set so that can process all traders in one second
     # NB minimum interarrival time of customer orders may be much less than this!!
@@ -3123,7 +4536,16 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
 
     time = starttime
 
-    pending_cust_orders = []
+    pending_cust_orders = CustomerOrderQueue()
+
+    orders_rng = session_rng(seed, 'orders')    # customer-order prices and times
+    if order_gen == 'batch':
+        orders_batch_rng = session_np_rng(seed, 'orders')
+    elif order_gen == 'loop':
+        orders_batch_rng = None
+    else:
+        sys.exit('FAIL: unknown order_gen %s' % order_gen)
+    sess_rng = session_rng(seed, 'session')     # the session loop's choice of which trader to poll
 
     if sess_vrbs:
         print('\n%s;  ' % sess_id)
@@ -3131,16 +4553,17 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
     # frames_done is record of what frames we have printed data for thus far
     frames_done = set()
 
-    while time < endtime:
-
-        # how much time left, as a percentage?
-        time_left = (endtime - time) / session_duration
-
-        if sess_vrbs:
-            print('\n\n%s; t=%08.2f (%4.1f/100) ' % (sess_id, time, time_left*100))
-
+    def issue_customer_orders(issued):
+        """
+        Issue any customer orders that are now due (or generate a fresh batch if none are pending),
+        and cancel any quotes on the LOB that have been overridden by newly-issued orders.
+        :param issued: passed through to customer_orders(), or None.
+        :return: <nothing>
+        """
+        nonlocal pending_cust_orders
         [pending_cust_orders, kills] = customer_orders(time, traders, trader_stats,
-                                                       order_schedule, pending_cust_orders, orders_verbose)
+                                                       order_schedule, pending_cust_orders, orders_verbose, issued,
+                                                       orders_rng, orders_batch_rng)
 
         # if any newly-issued customer orders mean quotes on the LOB need to be cancelled, kill them
         if len(kills) > 0:
@@ -3153,9 +4576,17 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
                     # exchange.del_order(time, traders[kill].lastquote, tape_dump, sess_vrbs)
                     exchange.del_order(time, traders[kill].lastquote, None, sess_vrbs)
 
-        # get a limit-order quote (or None) from a randomly chosen trader
-        tid = list(traders.keys())[random.randint(0, len(traders) - 1)]
-
+    def poll_trader(tid, time_left):
+        """
+        Get a limit-order quote (or None) from trader tid; if there is one, send it to the exchange,
+        then let all the traders respond to whatever happened.
+        :param tid: the trader-id of the trader being polled.
+        :param time_left: how much of the session is left, as a proportion.
+        :return: the order, or None if there was none or (if skip_requotes) it was already resting on the LOB.
+        """
+        nonlocal last_respond_time
+        lastquote = traders[tid].lastquote
+        lastquote_time = lastquote.time if lastquote is not None else None
         order = traders[tid].getorder(time, time_left, exchange.publish_lob(time, lobframes, lob_verbose))
         if sess_vrbs:
             print('trader=%s order=%s' % (tid, order))
@@ -3165,6 +4596,11 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
                 sys.exit('Bad ask')
             if order.otype == 'Bid' and order.price > traders[tid].orders[0].price:
                 sys.exit('Bad bid')
+            if order is lastquote and skip_requotes and exchange.is_resting(order):
+                # the trader has reused its last quote (see Trader.quote()) and it is still on the LOB:
+                # nothing would change on the LOB, so leave it be, with the time it was placed at
+                order.time = lastquote_time
+                return None
             # send order to exchange
             traders[tid].n_quotes = 1
             trade = exchange.process_order(time, order, tape_dump, process_verbose)
@@ -3174,12 +4610,13 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
                 traders[trade['party1']].bookkeep(time, trade, order, bookkeep_verbose)
                 traders[trade['party2']].bookkeep(time, trade, order, bookkeep_verbose)
                 if dumpfile_flags['dump_avgbals']:
-                    trade_stats(sess_id, traders, avg_bals, time, exchange.publish_lob(time, lobframes, lob_verbose))
+                    avg_bal_stats.write(time, exchange.publish_lob(time, lobframes, lob_verbose))
 
             # traders respond to whatever happened
             lob = exchange.publish_lob(time, lobframes, lob_verbose)
+            last_respond_time = time
             any_record_frame = False
-            for t in traders:
+            for t in responders:
                 # NB respond just updates trader's internal variables
                 # doesn't alter the LOB, so processing each trader in
                 # sequence (rather than random/shuffle) isn't a problem
@@ -3194,13 +4631,137 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
                 # record that we've written this frame
                 frames_done.add(int(time))
 
-        time = time + timestep
+        return order
+
+    if scheduler == 'poll':
+        # the original fixed-timestep loop: on every timestep, issue customer orders and poll one random trader
+        while time < endtime:
+
+            # how much time left, as a percentage?
+            time_left = (endtime - time) / session_duration
+
+            if sess_vrbs:
+                print('\n\n%s; t=%08.2f (%4.1f/100) ' % (sess_id, time, time_left*100))
+
+            issue_customer_orders(None)
+
+            # get a limit-order quote (or None) from a randomly chosen trader
+            tid = list(traders.keys())[sess_rng.randint(0, len(traders) - 1)]
+            poll_trader(tid, time_left)
+
+            time = time + timestep
+
+    elif scheduler == 'event':
+        # event-driven loop: same model as 'poll' (a timestep grid, one randomly chosen trader polled per timestep)
+        # but jumping straight from one timestep where something can happen to the next.
+        # Timesteps only matter if they issue customer orders, or if the trader polled is one for which
+        # wants_poll() is True: any other trader would return None from getorder() and nothing would change.
+        # These "candidates" are held in cands; the number of timesteps until one of them is picked is
+        # geometrically distributed, so that gap is sampled directly instead of stepping through it.
+        # The candidate set is allowed to hold stale entries: they are dropped when they are next picked.
+        n_traders = len(traders)
+        cands = []          # trader-ids of candidates
+        cand_index = {}     # trader-id => position in cands
+
+        def cand_add(c_tid):
+            if c_tid not in cand_index:
+                cand_index[c_tid] = len(cands)
+                cands.append(c_tid)
+
+        def cand_remove(c_tid):
+            # swap the last candidate into this one's place
+            pos = cand_index.pop(c_tid)
+            last = cands.pop()
+            if last != c_tid:
+                cands[pos] = last
+                cand_index[last] = pos
+
+        for t in traders:
+            if traders[t].wants_poll():
+                cand_add(t)
+
+        # the responders that can give themselves an order (see Trader.orders_itself)
+        self_orderers = [t for t in responders if traders[t].orders_itself]
+
+        step = 0            # index of the next timestep to be processed: its time is starttime + step * timestep
+        issued = []
+        while True:
+            # which is the next timestep at which customer orders get generated or issued?
+            if len(pending_cust_orders) < 1:
+                # nothing pending, so a new batch is generated at the next timestep
+                cust_step = step
+            else:
+                # orders are issued at the first timestep whose time is later than the order's time
+                next_issue = pending_cust_orders.next_issue_time()
+                cust_step = max(step, int((next_issue - starttime) / timestep))
+                while starttime + cust_step * timestep <= next_issue:
+                    cust_step += 1
+
+            # how many timesteps until a candidate trader gets picked?
+            p_cand = len(cands) / n_traders
+            if p_cand >= 1.0:
+                poll_step = step
+            elif p_cand > 0.0:
+                poll_step = step + int(math.log(1.0 - sess_rng.random()) / math.log(1.0 - p_cand))
+            else:
+                poll_step = cust_step
+
+            if cust_step <= poll_step:
+                # customer orders at this timestep; the trader picked at this timestep may or may not be a candidate
+                step = cust_step
+                time = starttime + step * timestep
+                if time >= endtime:
+                    break
+                issue_customer_orders(issued)
+                for c_tid in issued:
+                    cand_add(c_tid)
+                issued.clear()
+                polled = sess_rng.random() * n_traders < len(cands)
+            else:
+                step = poll_step
+                time = starttime + step * timestep
+                if time >= endtime:
+                    break
+                polled = True
+
+            if polled:
+                tid = cands[sess_rng.randint(0, len(cands) - 1)]
+                if not traders[tid].wants_poll():
+                    cand_remove(tid)
+                else:
+                    time_left = (endtime - time) / session_duration
+                    if sess_vrbs:
+                        print('\n\n%s; t=%08.2f (%4.1f/100) ' % (sess_id, time, time_left * 100))
+                    if poll_trader(tid, time_left) is not None:
+                        # the only traders that can have gained an order are those that give themselves orders
+                        # (the polled trader is already a candidate; customer orders are dealt with as they're issued;
+                        # NB traders that lost their order in a trade get dropped from cands when next picked)
+                        for t in self_orderers:
+                            if traders[t].wants_poll():
+                                cand_add(t)
+
+            step += 1
+
+        # the step that ended the loop may be a long way past the end of the session (the gap to the next poll is
+        # sampled, not stepped through), so bring time back to the end of the session for the end-of-session records
+        if time > endtime:
+            time = endtime
+
+    else:
+        sys.exit('FAIL: unknown scheduler %s' % scheduler)
 
     # session has ended
 
+    # bring the profitpertime of the traders that were left out of the respond loop up to date
+    if last_respond_time is not None:
+        for t in traders:
+            if not traders[t].needs_respond:
+                traders[t].respond(last_respond_time, None, None, False)
+
     # write trade_stats for this session (NB could use this to write end-of-session summary only)
     if dumpfile_flags['dump_avgbals']:
-        trade_stats(sess_id, traders, avg_bals, time, exchange.publish_lob(time, lobframes, lob_verbose))
+        avg_bal_stats.write(time, exchange.publish_lob(time, lobframes, lob_verbose))
+        avg_bal_stats.flush()
         avg_bals.close()
 
     if dumpfile_flags['dump_blotters']:
@@ -3213,6 +4774,322 @@ def market_session(sess_id, starttime, endtime, trader_spec, order_schedule, dum
     if dumpfile_flags['dump_lobs']:
         lobframes.close()
 
+    # summarise the final balances, per trader-type
+    summary = {}
+    for t in traders:
+        ttype = traders[t].ttype
+        if ttype not in summary:
+            summary[ttype] = {'n': 0, 'balance_sum': 0}
+        summary[ttype]['n'] += 1
+        summary[ttype]['balance_sum'] += traders[t].balance
+    return summary
+
+
+def schedule_offsetfn_read_file(filename, col_t, col_p, scale_factor=75, vrbs=False, cache=True, chunk_rows=65536):
+    """
+    Read in a CSV data-file for the supply/demand schedule time-varying price-offset value
+    The file is streamed through in chunks of rows, each chunk's timestamps and prices being parsed in bulk
+    with numpy, and the min & max prices are found in the same single pass.
+    The resulting event-list is cached in a sidecar file (filename + '.offsets.npz') keyed by a hash of the file's
+    contents and by the arguments, so reading the same file again just loads the sidecar.
+    :param filename: the CSV file to read
+    :param col_t: column in the CSV that has the time data
+    :param col_p: column in the CSV that has the price data
+    :param scale_factor: multiplier on prices
+    :param vrbs: verbosity Boolean: if True, print the normalised event-list; if False, stay silent.
+    :param cache: if True, use (and if need be, write) the sidecar cache file.
+    :param chunk_rows: how many rows of the CSV to parse in each chunk.
+    :return: on offset value event-list: one item for each change in offset value
+            -- each item is percentage time elapsed, followed by the new offset value at that time
+    """
+
+    # assumes data file is all for one date, sorted in time order, in correct format, etc. etc.
+    # rows for any date other than that of the first data row are skipped.
+    # timestamps are ISO-8601 style, e.g. 2025-02-11T00:05:00.000Z; prices may have commas, e.g. "97,691.23"
+
+    cache_fname = filename + '.offsets.npz'
+    cache_key = None
+    if cache:
+        file_hash = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                file_hash.update(block)
+        cache_key = '%s,%d,%d,%r' % (file_hash.hexdigest(), col_t, col_p, scale_factor)
+        if os.path.exists(cache_fname):
+            try:
+                with np.load(cache_fname) as cached:
+                    if str(cached['key']) == cache_key:
+                        offsetfn_eventlist = [[t, p] for t, p in zip(cached['times'].tolist(),
+                                                                      cached['prices'].tolist())]
+                        if vrbs:
+                            print('%s: %d offset events from cache %s' % (filename, len(offsetfn_eventlist),
+                                                                         cache_fname))
+                        return offsetfn_eventlist
+            except (OSError, ValueError, KeyError):
+                pass    # unreadable or stale cache file: just rebuild it
+
+    # single pass: get time & price events, find out how long session is, get min & max price
+    first_date = None
+    first_secs = None
+    minprice = None
+    maxprice = None
+    time_chunks = []
+    price_chunks = []
+    timestamps = []
+    price_strs = []
+
+    def parse_chunk():
+        """
+        Parse the chunk of rows accumulated in timestamps & price_strs, appending the results to
+        time_chunks & price_chunks and updating first_date, first_secs, minprice and maxprice.
+        """
+        nonlocal first_date, first_secs, minprice, maxprice
+        if len(timestamps) < 1:
+            return
+        stamps = np.array(timestamps)
+        dates = stamps.astype('U10')
+        if first_date is None:
+            first_date = dates[0]
+        keep = dates == first_date
+        # time of day: characters 11 to 18 of each timestamp, HH:MM:SS
+        chars = stamps[keep].astype('S19').view(np.uint8).reshape(-1, 19)[:, 11:19].astype(np.int64)
+        digits = chars[:, [0, 1, 3, 4, 6, 7]] - ord('0')
+        if (np.any(chars[:, 2] != ord(':')) or np.any(chars[:, 5] != ord(':')) or
+                np.any(digits < 0) or np.any(digits > 9)):
+            sys.exit('FAIL: bad timestamp in %s (need YYYY-MM-DD?HH:MM:SS...)' % filename)
+        secs = ((digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 2] * 10 + digits[:, 3]) * 60 +
+                digits[:, 4] * 10 + digits[:, 5])
+        if len(secs) > 0:
+            # delete any commas so 1,000,000 becomes 1000000
+            prices = np.char.replace(np.array(price_strs)[keep], ',', '').astype(np.float64)
+            if first_secs is None:
+                first_secs = secs[0]
+            time_chunks.append((secs - first_secs).astype(np.float64))
+            price_chunks.append(prices)
+            chunk_min = prices.min()
+            chunk_max = prices.max()
+            if minprice is None or chunk_min < minprice:
+                minprice = chunk_min
+            if maxprice is None or chunk_max > maxprice:
+                maxprice = chunk_max
+        timestamps.clear()
+        price_strs.clear()
+
+    with open(filename, 'r', newline='') as rwd_file:
+        rwd_csv = csv.reader(rwd_file)
+        next(rwd_csv, None)     # first row is header
+        for line in rwd_csv:
+            timestamps.append(line[col_t])
+            price_strs.append(line[col_p])
+            if len(timestamps) >= chunk_rows:
+                parse_chunk()
+        parse_chunk()
+
+    if len(time_chunks) < 1:
+        sys.exit('FAIL: no price data in %s' % filename)
+    timesincestart = np.concatenate(time_chunks)
+    priceevents = np.concatenate(price_chunks)
+
+    # normalise times to fractions of entire time-series duration
+    # & normalise price range
+    pricerange = maxprice - minprice
+    endtime = timesincestart[-1]
+    if pricerange <= 0 or endtime <= 0:
+        sys.exit('FAIL: price data in %s spans zero time or zero price-range' % filename)
+    normld_prices = np.clip((priceevents - minprice) / pricerange, 0.0, 1.0)
+    # scale & convert to integer cents
+    prices = np.rint(normld_prices * scale_factor).astype(np.int64)
+    times = timesincestart / endtime
+
+    if cache:
+        try:
+            with open(cache_fname, 'wb') as f:
+                np.savez(f, key=np.array(cache_key), times=times, prices=prices)
+        except OSError:
+            pass    # e.g. read-only directory: carry on without a cache
+
+    offsetfn_eventlist = [[t, p] for t, p in zip(times.tolist(), prices.tolist())]
+    if vrbs:
+        for event in offsetfn_eventlist:
+            print(event)
+
+    return offsetfn_eventlist
+
+
+class OffsetEventList:
+    """
+    An offset event-list (as returned by schedule_offsetfn_read_file()) compiled for fast lookup:
+    the event times are held in a sorted list and searched by bisection, so finding the offset for
+    a given time is O(log n) rather than the O(n) walk done by schedule_offsetfn_from_eventlist().
+    The segment of the event-list that the previous lookup fell in is remembered, so a run of lookups at
+    times that move forward slowly (the usual case) mostly don't need to search at all.
+    Gives exactly the same offset values as schedule_offsetfn_from_eventlist().
+    An OffsetEventList is callable, so it can be used directly as the offset function in a schedule range:
+    e.g. range1 = (75, 110, (OffsetEventList(end_time, events), []))
+    """
+
+    def __init__(self, final_time, offset_events):
+        """
+        Compile an offset event-list
+        :param final_time: the final time (the end-time) of the session.
+        :param offset_events: the offset event-list: one item for each change in offset value
+                    -- each item is percentage time elapsed, followed by the new offset value at that time.
+                    The items must be in order of time elapsed, as schedule_offsetfn_read_file() returns them.
+        """
+        if offset_events is None or len(offset_events) < 1:
+            sys.exit('FAIL: OffsetEventList needs at least one event')
+        self.final_time = float(final_time)
+        self.times = [event[0] for event in offset_events]
+        self.values = [event[1] for event in offset_events]
+        for i in range(1, len(self.times)):
+            if self.times[i] < self.times[i - 1]:
+                sys.exit('FAIL: OffsetEventList events not in time order')
+        self.times_np = np.array(self.times, dtype=np.float64)
+        self.values_np = np.array(self.values)
+        # the segment of percent-elapsed values [seg_lo, seg_hi) that the last lookup fell in, and its offset
+        self.seg_lo = 1.0
+        self.seg_hi = 0.0
+        self.seg_value = None
+
+    def offset(self, time):
+        """
+        Returns the price offset-value for a given time.
+        :param time: the time.
+        :return: the price offset value at that time.
+        """
+        percent_elapsed = time / self.final_time
+        if self.seg_lo <= percent_elapsed < self.seg_hi:
+            return self.seg_value
+        # index of the first event whose time is later than percent_elapsed, or the final event if there is none
+        n = len(self.times)
+        i = bisect.bisect_right(self.times, percent_elapsed)
+        if i >= n - 1:
+            i = n - 1
+            self.seg_hi = math.inf
+        else:
+            self.seg_hi = self.times[i]
+        if i > 0:
+            self.seg_lo = self.times[i - 1]
+        else:
+            self.seg_lo = -math.inf
+        self.seg_value = self.values[i]
+        return self.seg_value
+
+    def offsets(self, times):
+        """
+        Returns the price offset-values for a whole batch of times in one go.
+        :param times: sequence (or numpy array) of times, in any order.
+        :return: numpy array of the price offset values at those times.
+        """
+        percent_elapsed = np.asarray(times, dtype=np.float64) / self.final_time
+        idx = np.searchsorted(self.times_np, percent_elapsed, side='right')
+        np.minimum(idx, len(self.times) - 1, out=idx)
+        return self.values_np[idx]
+
+    def __call__(self, time, *params):
+        """
+        Offset-function interface, as used in the ranges of a supply/demand schedule: any params are ignored.
+        :param time: the time.
+        :return: the price offset value at that time.
+        """
+        return self.offset(time)
+
+    def __len__(self):
+        return len(self.times)
+
+
+def schedule_offsetfn_from_eventlist(time, params):
+    """
+    Returns a price offset-value for the current time, by reading from an offset event-list.
+    :param time: the current time
+    :param params: a list of parameter values...
+        params[1] is the final time (the end-time) of the current session.
+        params[2] is the offset event-list: one item for each change in offset value
+                    -- each item is percentage time elapsed, followed by the new offset value at that time;
+                    or an OffsetEventList, in which case the final time in params[1] is ignored.
+    :return: integer price offset value
+    """
+
+    offset_events = params[1]
+    if isinstance(offset_events, OffsetEventList):
+        return offset_events.offset(time)
+
+    final_time = float(params[0])
+    # this is quite inefficient: on every call it walks the event-list -- use an OffsetEventList instead
+    percent_elapsed = time/final_time
+    offset = None
+    for event in offset_events:
+        offset = event[1]
+        if percent_elapsed < event[0]:
+            break
+    return offset
+
+
+def schedule_offsetfn_increasing_sinusoid(t, params):
+    """
+    Returns sinusoidal time-dependent price-offset, steadily increasing in frequency & amplitude
+    :param t: time
+    :param params: set of parameters for the offsetfn: this is empty-set for this offsetfn but nonempty in others
+    :return: the time-dependent price offset at time t
+    """
+    if params is None:  # this test of params is here only to prevent PyCharm from warning about unused parameters
+        pass
+    scale = -7500
+    multiplier = 7500000    # determines rate of increase of frequency and amplitude
+    offset = ((scale * t) / multiplier) * (1 + math.sin((t*t)/(multiplier * math.pi)))
+    return int(round(offset, 0))
+
+
+def run_trial(trial):
+    """
+    Run one trial (i.e., one market session): this is what each worker process in trial_farm() does.
+    The trial's own seed is passed to market_session(), which gives each component of the session its own
+    random-number stream seeded from it (see session_rng), so the trial's results depend only on its seed and not
+    on which worker process it ran in, or what that worker ran before it. The global random-number generator is
+    seeded too, for the benefit of any user-supplied code (e.g. offset functions) that draws from it.
+    :param trial: dictionary of the trial's details: 'trial_id', 'seed', and the market_session() arguments
+            'starttime', 'endtime', 'trader_spec', 'order_schedule', 'dumpfile_flags', 'sess_vrbs'.
+    :return: (trial_id, seed, summary) where summary is what market_session() returns.
+    """
+    random.seed(trial['seed'])
+    summary = market_session(trial['trial_id'], trial['starttime'], trial['endtime'], trial['trader_spec'],
+                             trial['order_schedule'], trial['dumpfile_flags'], trial['sess_vrbs'],
+                             seed=trial['seed'])
+    return trial['trial_id'], trial['seed'], summary
+
+
+def trial_farm(trials, n_workers=None, summary_fname=None):
+    """
+    Run a set of independent trials, farming them out across a pool of worker processes.
+    Each trial writes its own output files, named by its trial_id, just as if it had been run on its own.
+    :param trials: list of trials, each a dictionary as described in run_trial().
+    :param n_workers: how many worker processes to use; None => one per CPU core; 1 => run in this process.
+    :param summary_fname: if not None, the merged results are written to this CSV file, one line per trial
+            in the order that trials are listed: trial_id, seed, then four columns for each trader-type:
+            TraderTypeCode, TotalProfitForThisTraderType, NumberOfTradersOfThisType, AverageProfitPerTraderOfThisType
+    :return: list of (trial_id, seed, summary) tuples, in the same order as trials.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    if n_workers == 1 or len(trials) < 2:
+        results = [run_trial(trial) for trial in trials]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(n_workers, len(trials))) as pool:
+            results = list(pool.map(run_trial, trials))
+
+    if summary_fname is not None:
+        summary_file = open(summary_fname, 'w')
+        for trial_id, seed, summary in results:
+            summary_file.write('%s, %d, ' % (trial_id, seed))
+            for ttype in sorted(summary.keys()):
+                n = summary[ttype]['n']
+                s = summary[ttype]['balance_sum']
+                summary_file.write('%s, %d, %d, %f, ' % (ttype, s, n, s / float(n)))
+            summary_file.write('\n')
+        summary_file.close()
+
+    return results
+
 
 #############################
 # # Below here is where we set up and run a whole series of experiments
@@ -3234,133 +5111,6 @@ if __name__ == "__main__":
     duration = end_time - start_time
 
 
-    def schedule_offsetfn_read_file(filename, col_t, col_p, scale_factor=75):
-        """
-        Read in a CSV data-file for the supply/demand schedule time-varying price-offset value
-        :param filename: the CSV file to read
-        :param col_t: column in the CSV that has the time data
-        :param col_p: column in the CSV that has the price data
-        :param scale_factor: multiplier on prices
-        :return: on offset value event-list: one item for each change in offset value
-                -- each item is percentage time elapsed, followed by the new offset value at that time
-        """
-        
-        vrbs = True
-        
-        # does two passes through the file
-        # assumes data file is all for one date, sorted in time order, in correct format, etc. etc.
-        rwd_csv = csv.reader(open(filename, 'r'))
-        
-        # first pass: get time & price events, find out how long session is, get min & max price
-        minprice = None
-        maxprice = None
-        firsttimeobj = None
-        timesincestart = 0
-        priceevents = []
-        
-        first_row_is_header = True
-        this_is_first_row = True
-        this_is_first_data_row = True
-        first_date = None
-        
-        for line in rwd_csv:
-            
-            if vrbs:
-                print(line)
-            
-            if this_is_first_row and first_row_is_header:
-                this_is_first_row = False
-                this_is_first_data_row = True
-                continue
-                
-            row_date = line[col_t][:10]
-            
-            if this_is_first_data_row:
-                first_date = row_date
-                this_is_first_data_row = False
-                
-            if row_date != first_date:
-                continue
-                
-            time = line[col_t][11:19]
-            if firsttimeobj is None:
-                firsttimeobj = datetime.strptime(time, '%H:%M:%S')
-                
-            timeobj = datetime.strptime(time, '%H:%M:%S')
-            
-            price_str = line[col_p]
-            # delete any commas so 1,000,000 becomes 1000000
-            price_str_no_commas = price_str.replace(',', '')
-            price = float(price_str_no_commas)
-            
-            if minprice is None or price < minprice:
-                minprice = price
-            if maxprice is None or price > maxprice:
-                maxprice = price
-            timesincestart = (timeobj - firsttimeobj).total_seconds()
-            priceevents.append([timesincestart, price])
-            
-            if vrbs:
-                print(row_date, time, timesincestart, price)
-            
-        # second pass: normalise times to fractions of entire time-series duration
-        #              & normalise price range
-        pricerange = maxprice - minprice
-        endtime = float(timesincestart)
-        offsetfn_eventlist = []
-        for event in priceevents:
-            # normalise price
-            normld_price = (event[1] - minprice) / pricerange
-            # clip
-            normld_price = min(normld_price, 1.0)
-            normld_price = max(0.0, normld_price)
-            # scale & convert to integer cents
-            price = int(round(normld_price * scale_factor))
-            normld_event = [event[0] / endtime, price]
-            if vrbs:
-                print(normld_event)
-            offsetfn_eventlist.append(normld_event)
-        
-        return offsetfn_eventlist
-
-
-    def schedule_offsetfn_from_eventlist(time, params):
-        """
-        Returns a price offset-value for the current time, by reading from an offset event-list.
-        :param time: the current time
-        :param params: a list of parameter values...
-            params[1] is the final time (the end-time) of the current session.
-            params[2] is the offset event-list: one item for each change in offset value
-                        -- each item is percentage time elapsed, followed by the new offset value at that time
-        :return: integer price offset value
-        """
-
-        final_time = float(params[0])
-        offset_events = params[1]
-        # this is quite inefficient: on every call it walks the event-list
-        percent_elapsed = time/final_time
-        offset = None
-        for event in offset_events:
-            offset = event[1]
-            if percent_elapsed < event[0]:
-                break
-        return offset
-
-
-    def schedule_offsetfn_increasing_sinusoid(t, params):
-        """
-        Returns sinusoidal time-dependent price-offset, steadily increasing in frequency & amplitude
-        :param t: time
-        :param params: set of parameters for the offsetfn: this is empty-set for this offsetfn but nonempty in others
-        :return: the time-dependent price offset at time t
-        """
-        if params is None:  # this test of params is here only to prevent PyCharm from warning about unused parameters
-            pass
-        scale = -7500
-        multiplier = 7500000    # determines rate of increase of frequency and amplitude
-        offset = ((scale * t) / multiplier) * (1 + math.sin((t*t)/(multiplier * math.pi)))
-        return int(round(offset, 0))
-
     # Here is an example of how to use the offset function
     #
     # range1 = (10, 190, (schedule_offsetfn, args)) # args is the list of arguments to the function
@@ -3377,14 +5127,14 @@ if __name__ == "__main__":
 
     offsetfn_events = None
     if price_offset_filename is not None:
-        offsetfn_events = schedule_offsetfn_read_file(price_offset_filename, 0, 1)
+        offsetfn_events = OffsetEventList(end_time, schedule_offsetfn_read_file(price_offset_filename, 0, 1))
 
     # supply schedule (defines the supply curve)
-    range1 = (75, 110, (schedule_offsetfn_from_eventlist, [[end_time, offsetfn_events]]))
+    range1 = (75, 110, (offsetfn_events, []))
     supply_schedule = [{'from': start_time, 'to': end_time, 'ranges': [range1], 'stepmode': 'random'}]
 
     # demand schedule (defines the demand curve)
-    range2 = (125, 90, (schedule_offsetfn_from_eventlist, [[end_time, offsetfn_events]]))
+    range2 = (125, 90, (offsetfn_events, []))
     demand_schedule = [{'from': start_time, 'to': end_time, 'ranges': [range2], 'stepmode': 'random'}]
 
     # new customer orders arrive at each trader approx once every order_interval seconds
@@ -3405,6 +5155,16 @@ if __name__ == "__main__":
     # n_recorded is how many trials (i.e. market sessions) to write full data-files for
     n_trials_recorded = bse_config.n_trials_recorded
 
+    # how many worker processes to farm the trials out to: None => one per CPU core
+    n_workers = getattr(bse_config, 'n_workers', None)
+
+    # each trial's random-number seed is base_seed + trial-number, so any trial can be re-run on its own
+    base_seed = getattr(bse_config, 'seed', None)
+    if base_seed is None:
+        base_seed = chrono.time_ns() % 1000000000
+        print('Random seed for this set of trials: base_seed=%d' % base_seed)
+
+    trials = []
     trial = 1
 
     while trial < (n_trials+1):
@@ -3441,11 +5201,16 @@ if __name__ == "__main__":
 
         # dump_flags = bse_config.dump_flags
 
-        # simulate the market session
-        market_session(trial_id, start_time, end_time, traders_spec, order_sched, dump_flags, verbose)
+        # the market session for this trial gets added to the list to be run
+        trials.append({'trial_id': trial_id, 'seed': base_seed + trial,
+                       'starttime': start_time, 'endtime': end_time, 'trader_spec': traders_spec,
+                       'order_schedule': order_sched, 'dumpfile_flags': dump_flags, 'sess_vrbs': verbose})
 
         trial = trial + 1
 
+    # simulate the market sessions, and write the merged per-trial results
+    trial_farm(trials, n_workers, 'output/raw/bse_d%03d_i%02d_trials.csv' % (n_days, order_interval))
+
     # The code in comments below here is for illustration, in case you want to do an exhaustive sweep of all possible
     # combinations of some set of trading strategies: if its of no interest, it can be deleted.
     #
@@ -0,0 +1,178 @@
+"""
+Allocation & GC cost of BSE's per-event records (Order and Trade).
+
+Reports:
+  * the memory each Order and trade record takes (measured with tracemalloc over a large number of live records,
+    so it includes everything the record allocates), and the time to create an Order, alongside the same figures
+    for the un-slotted Order class and dictionary trade records that BSE used before;
+  * an allocation-heavy churn loop for each kind of record: many records are created while a fixed number of the
+    most recent are kept alive (as the LOB and blotters keep them), and the garbage collector's work is counted
+    from gc.get_stats() before and after, and timed via gc.callbacks;
+  * the run time, GC collections and time, and peak memory traced by tracemalloc, over a market session of
+    600 ZI traders with the polling scheduler.
+
+Usage (from the directory holding bse_config.py, which BSE.py imports):
+    python benchmarks/bench_records.py [path/to/BSE.py]
+Give the path of an older BSE.py (e.g. one written out by "git show <commit>:BSE.py > old_BSE.py")
+to get the session figures for that version, for comparison.
+"""
+
+import collections
+import gc
+import importlib.util
+import inspect
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.getcwd())
+
+
+class DictOrder:
+    """ an Order as it was before it had __slots__ """
+
+    def __init__(self, tid, otype, price, qty, time, qid):
+        self.tid = tid
+        self.otype = otype
+        self.price = price
+        self.qty = qty
+        self.time = time
+        self.qid = qid
+
+
+def dict_trade(time, price, party1, party2, qty):
+    """ a trade record as it was before the Trade class """
+    return {'type': 'Trade', 'time': time, 'price': price, 'party1': party1, 'party2': party2, 'qty': qty}
+
+
+def load_bse(path):
+    spec = importlib.util.spec_from_file_location('BSE', path)
+    bse = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bse)
+    return bse
+
+
+class GCTimer:
+    """ totals the time spent in the garbage collector, via gc.callbacks """
+
+    def __init__(self):
+        self.total = 0.0
+        self.started = 0.0
+
+    def callback(self, phase, info):
+        if phase == 'start':
+            self.started = time.perf_counter()
+        else:
+            self.total += time.perf_counter() - self.started
+
+    def __enter__(self):
+        gc.callbacks.append(self.callback)
+        return self
+
+    def __exit__(self, *exc):
+        gc.callbacks.remove(self.callback)
+
+
+def collections_since(stats):
+    """ the number of collections of each generation since gc.get_stats() gave stats """
+    return [now['collections'] - then['collections'] for now, then in zip(gc.get_stats(), stats)]
+
+
+def record_bytes(make, n=100000):
+    """
+    Memory per record: the memory traced while n records are alive, less that of a list of n Nones.
+    The records are all made with the same small ints, so only the records themselves are counted.
+    """
+    gc.collect()
+    tracemalloc.start()
+    records = [make() for _ in range(n)]
+    with_records = tracemalloc.get_traced_memory()[0]
+    del records
+    nones = [None for _ in range(n)]
+    without = tracemalloc.get_traced_memory()[0]
+    del nones
+    tracemalloc.stop()
+    return (with_records - without) / n
+
+
+def creation_ns(make, n=200000):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        make()
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+def record_figures(bse):
+    makers = [('Order', lambda: bse.Order(7, 'Bid', 100, 1, 0.5, 9)),
+              ('un-slotted Order', lambda: DictOrder(7, 'Bid', 100, 1, 0.5, 9)),
+              ('Trade', lambda: bse.Trade(0.5, 100, 7, 9, 1)),
+              ('trade dict', lambda: dict_trade(0.5, 100, 7, 9, 1))]
+    for name, make in makers:
+        print('%-17s %4.0f bytes, %4.0f ns to create' % (name + ':', record_bytes(make), creation_ns(make)))
+
+
+def churn_figures(bse, n=3000000, live=300000):
+    makers = [('Order', lambda i: bse.Order(i, 'Bid', 100, 1, 0.5, i)),
+              ('un-slotted Order', lambda i: DictOrder(i, 'Bid', 100, 1, 0.5, i)),
+              ('Trade', lambda i: bse.Trade(0.5, 100, i, i, 1)),
+              ('trade dict', lambda i: dict_trade(0.5, 100, i, i, 1))]
+    print('churn: %d records created, the last %d kept alive' % (n, live))
+    for name, make in makers:
+        ring = collections.deque(maxlen=live)
+        gc.collect()
+        stats = gc.get_stats()
+        with GCTimer() as gc_time:
+            t0 = time.perf_counter()
+            for i in range(n):
+                ring.append(make(i))
+            elapsed = time.perf_counter() - t0
+        print('  %-17s %.2fs, gc %.3fs, collections per generation %s' %
+              (name + ':', elapsed, gc_time.total, collections_since(stats)))
+        del ring
+
+
+def session_figures(bse, n_per_type=100, duration=3600):
+    spec = {'buyers': [('ZIC', n_per_type), ('SHVR', n_per_type), ('GVWY', n_per_type)],
+            'sellers': [('ZIC', n_per_type), ('GVWY', n_per_type), ('SNPR', n_per_type)]}
+    sup = [{'from': 0, 'to': duration, 'ranges': [(75, 110)], 'stepmode': 'random'}]
+    dem = [{'from': 0, 'to': duration, 'ranges': [(125, 90)], 'stepmode': 'random'}]
+    order_sched = {'sup': sup, 'dem': dem, 'interval': 10, 'timemode': 'drip-poisson'}
+    flags = {'dump_blotters': False, 'dump_lobs': False, 'dump_strats': False, 'dump_avgbals': False,
+             'dump_tape': False}
+    # the polling scheduler, which every version has (some versions have the event-driven one as their default)
+    options = {}
+    if 'scheduler' in inspect.signature(bse.market_session).parameters:
+        options['scheduler'] = 'poll'
+
+    for traced in (False, True):
+        random.seed(1)
+        gc.collect()
+        stats = gc.get_stats()
+        if traced:
+            tracemalloc.start()
+        with GCTimer() as gc_time:
+            t0 = time.perf_counter()
+            bse.market_session('bench', 0, duration, spec, order_sched, flags, False, **options)
+            elapsed = time.perf_counter() - t0
+        if traced:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print('session (%d traders, %d s) under tracemalloc: peak traced memory %.0f KB' %
+                  (6 * n_per_type, duration, peak / 1024))
+        else:
+            print('session (%d traders, %d s): %.2fs, gc %.3fs, collections per generation %s' %
+                  (6 * n_per_type, duration, elapsed, gc_time.total, collections_since(stats)))
+
+
+if __name__ == '__main__':
+    bse_path = sys.argv[1] if len(sys.argv) > 1 else \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'BSE.py')
+    bse_module = load_bse(bse_path)
+    bse_module.verbose = False
+    print(os.path.abspath(bse_path))
+    if hasattr(bse_module, 'Trade'):
+        record_figures(bse_module)
+        churn_figures(bse_module)
+    session_figures(bse_module)
@@ -0,0 +1,16 @@
+"""
+Shared set-up for the tests: make BSE.py importable from a clean checkout.
+
+BSE.py imports bse_config, the settings file that bse_settings.py writes, but only reads it in its __main__ block.
+If there is no bse_config to be found, an empty stand-in module is put in sys.modules so that "import BSE" works.
+"""
+
+import importlib.util
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+if importlib.util.find_spec('bse_config') is None:
+    sys.modules['bse_config'] = types.ModuleType('bse_config')
@@ -0,0 +1,67 @@
+"""
+The two order-book implementations, OrderbookHalf ('levels') and OrderbookHalfTicks ('ticks'), should give
+exactly the same matching: the same best prices and trader-ids, the same anonymized LOB, and the same trades,
+for the same sequence of orders through Exchange.process_order() and Exchange.del_order().
+"""
+
+import random
+
+import pytest
+
+import BSE
+
+
+def book_state(exchange):
+    """ everything about the state of an exchange's book that the two implementations should agree on """
+    state = {}
+    for side in ('bids', 'asks'):
+        half = getattr(exchange, side)
+        state[side] = (half.best_price, half.best_tid, half.n_orders, half.lob_depth,
+                       [tuple(level) for level in half.lob_anon])
+    return state
+
+
+def trade_fields(trade):
+    if trade is None:
+        return None
+    return tuple(trade[key] for key in trade.keys())
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_same_matching(seed):
+    rng = random.Random(seed)
+    levels = BSE.Exchange('levels')
+    ticks = BSE.Exchange('ticks')
+    n_trades = 0
+    for step in range(5000):
+        time = step / 10.0
+        tid = rng.randrange(40)
+        otype = rng.choice(['Bid', 'Ask'])
+        if rng.random() < 0.2:
+            # cancel this trader's order on that side, if it has one
+            if otype == 'Bid':
+                halves = (levels.bids, ticks.bids)
+            else:
+                halves = (levels.asks, ticks.asks)
+            if tid in halves[0].orders:
+                levels.del_order(time, halves[0].orders[tid], None, False)
+                ticks.del_order(time, halves[1].orders[tid], None, False)
+        else:
+            # prices clustered around 100, with the odd one at the ends of the price range, to make plenty of trades
+            if rng.random() < 0.02:
+                price = rng.choice([BSE.bse_sys_minprice, BSE.bse_sys_maxprice])
+            else:
+                price = int(rng.gauss(100, 8))
+            qid = rng.randrange(1000)
+            trade_levels = levels.process_order(time, BSE.Order(tid, otype, price, 1, time, qid), None, False)
+            trade_ticks = ticks.process_order(time, BSE.Order(tid, otype, price, 1, time, qid), None, False)
+            assert trade_fields(trade_levels) == trade_fields(trade_ticks)
+            if trade_levels is not None:
+                n_trades += 1
+        assert book_state(levels) == book_state(ticks)
+        lob_levels = levels.publish_lob(time, None, False)
+        lob_ticks = ticks.publish_lob(time, None, False)
+        assert lob_levels['bids']['lob'] == lob_ticks['bids']['lob']
+        assert lob_levels['asks']['lob'] == lob_ticks['asks']['lob']
+    assert n_trades > 100
+    assert [trade_fields(t) for t in levels.tape.trades] == [trade_fields(t) for t in ticks.tape.trades]
@@ -0,0 +1,84 @@
+"""
+Statistical equivalence of TraderPRZI.sample_price() (closed-form CDF, bisection) and the CDF look-up tables
+of TraderPRZI.calc_cdf_lut() that PRZI/PRSH/PRDE traders sample from by default.
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+import BSE
+
+THETA0 = 100
+M = 4
+
+
+def lut_price(lut, u):
+    """ the price an inverse lookup on a LUT gives for u, as in TraderPRZI.getorder() """
+    index = min(int(lut['cdf'].searchsorted(u, side='right')), len(lut['cdf']) - 1)
+    return int(lut['prices'][index])
+
+
+def random_case(rng):
+    """ a random (strategy, dirn, pmin, pmax), with extra weight on the special & extreme strategy values """
+    strategy = rng.choice([rng.uniform(-1.0, 1.0), 0.0, 1.0, -1.0, 0.5, -0.5,
+                           rng.uniform(-0.001, 0.001), rng.uniform(0.99, 1.0), rng.uniform(-1.0, -0.99)])
+    dirn = rng.choice(['buy', 'sell'])
+    pmin = rng.randint(1, 300)
+    pmax = pmin + rng.choice([0, 1, 2, 3, rng.randint(0, 400)])
+    return strategy, dirn, pmin, pmax
+
+
+def test_same_price_for_same_u():
+    """ for the same u, the closed-form sampler should find the same price as the LUT """
+    rng = random.Random(1)
+    n_draws = 0
+    n_diff = 0
+    for _ in range(2000):
+        strategy, dirn, pmin, pmax = random_case(rng)
+        lut = BSE.TraderPRZI.calc_cdf_lut(strategy, THETA0, M, dirn, pmin, pmax)
+        for _ in range(20):
+            u = rng.random()
+            price = BSE.TraderPRZI.sample_price(strategy, THETA0, M, dirn, pmin, pmax, u)
+            assert pmin <= price <= pmax
+            n_draws += 1
+            if price != lut_price(lut, u):
+                n_diff += 1
+    # the two calculate the CDF differently, so a u within rounding error of a step could in principle differ
+    assert n_diff <= n_draws * 0.001
+
+
+@pytest.mark.parametrize('strategy', [-1.0, -0.999, -0.6, -0.0005, 0.0, 0.0005, 0.3, 0.999, 1.0])
+@pytest.mark.parametrize('dirn', ['buy', 'sell'])
+def test_sample_distribution(strategy, dirn):
+    """ chi-squared goodness-of-fit of closed-form samples against the LUT's probabilities """
+    pmin = 60
+    pmax = 100
+    lut = BSE.TraderPRZI.calc_cdf_lut(strategy, THETA0, M, dirn, pmin, pmax)
+    probs = np.diff(np.concatenate(([0.0], lut['cdf'])))
+
+    rng = random.Random(2)
+    n = 20000
+    counts = np.zeros(len(probs))
+    for _ in range(n):
+        counts[BSE.TraderPRZI.sample_price(strategy, THETA0, M, dirn, pmin, pmax, rng.random()) - pmin] += 1
+
+    # no samples where the LUT has zero probability...
+    assert not np.any(counts[probs <= 0.0])
+    # ...and, pooling prices with small expected counts, a chi-squared statistic that isn't far into the tail
+    expected = probs * n
+    big = expected >= 5
+    obs = np.append(counts[big], counts[~big].sum())
+    exp = np.append(expected[big], expected[~big].sum())
+    keep = exp > 0
+    chi2 = float(np.sum((obs[keep] - exp[keep]) ** 2 / exp[keep]))
+    df = max(int(np.sum(keep)) - 1, 1)
+    assert chi2 < df + 5 * np.sqrt(2 * df)
+
+
+def test_single_price_range():
+    """ when pmin == pmax there is only one possible price, as in calc_cdf_lut() """
+    for dirn in ('buy', 'sell'):
+        for u in (0.0, 0.5, 0.999999):
+            assert BSE.TraderPRZI.sample_price(0.4, THETA0, M, dirn, 87, 87, u) == 87